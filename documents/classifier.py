@@ -0,0 +1,172 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+# Keyword evidence per normalised document type; classify_text_with_llm's shortcut uses it too
+DOCUMENT_KEYWORDS = {
+    "Payslip": ["payslip", "net pay", "gross pay", "salary", "income tax", "pay date", "ytd"],
+    "Contract of Employment": ["employment contract", "contract of employment", "job title", "employer", "position",
+                               "probation", "notice period"],
+    "Bank Statement": ["account number", "sort code", "bank statement", "transaction", "balance brought forward",
+                       "opening balance", "closing balance"],
+    "ID Proof(Passport, Driving License)": ["passport", "driving license", "driving licence", "identity card",
+                                           "nationality", "date of expiry"],
+    "P60": ["p60", "tax year ending", "hmrc", "end of year certificate"],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9£]{2,}")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def keyword_scores(text):
+    """{document_type: number of its keywords found in `text`}."""
+    text_lower = text.lower()
+    return {
+        doc_type: sum(1 for keyword in keywords if keyword in text_lower)
+        for doc_type, keywords in DOCUMENT_KEYWORDS.items()
+    }
+
+
+def keyword_classify(text):
+    """
+    (document_type, confidence) from keyword hits. Confidence grows with the number of hits
+    and shrinks when a second type scores nearly as well.
+    """
+    scores = keyword_scores(text)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (best_type, best), (_, second) = ranked[0], ranked[1]
+    if best == 0:
+        return "Unknown", 0.0
+
+    strength = min(1.0, best / 3)
+    margin = (best - second) / best
+    return best_type, round(strength * margin, 3)
+
+
+class TfidfCentroidClassifier:
+    """
+    Tiny TF-IDF nearest-centroid model trained from stored PageAnalysis text/labels.
+    Serialised as JSON so it needs nothing beyond NumPy at runtime.
+    """
+    def __init__(self, vocabulary, idf, labels, centroids):
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.labels = labels
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+
+    @classmethod
+    def train(cls, texts, labels, max_features=5000, min_df=2):
+        documents = [Counter(tokenize(text)) for text in texts]
+        df = Counter()
+        for counts in documents:
+            df.update(counts.keys())
+
+        terms = [term for term, freq in df.most_common() if freq >= min_df][:max_features]
+        vocabulary = {term: idx for idx, term in enumerate(terms)}
+        n_docs = len(documents)
+        idf = np.array([math.log((1 + n_docs) / (1 + df[term])) + 1 for term in terms], dtype=np.float32)
+
+        label_names = sorted(set(labels))
+        centroids = np.zeros((len(label_names), len(terms)), dtype=np.float32)
+        for counts, label in zip(documents, labels):
+            centroids[label_names.index(label)] += cls._vectorize(counts, vocabulary, idf)
+
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms == 0, 1, norms)
+        return cls(vocabulary, idf, label_names, centroids)
+
+    @staticmethod
+    def _vectorize(counts, vocabulary, idf):
+        vector = np.zeros(len(vocabulary), dtype=np.float32)
+        for term, count in counts.items():
+            idx = vocabulary.get(term)
+            if idx is not None:
+                vector[idx] = 1 + math.log(count)
+        vector *= idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def predict(self, text):
+        """
+        (document_type, confidence): softmax over cosine similarity to each class centroid.
+        """
+        vector = self._vectorize(Counter(tokenize(text)), self.vocabulary, self.idf)
+        if not vector.any() or not self.labels:
+            return "Unknown", 0.0
+
+        similarities = self.centroids @ vector
+        weights = np.exp((similarities - similarities.max()) * 10)
+        probabilities = weights / weights.sum()
+        best = int(probabilities.argmax())
+        return self.labels[best], round(float(probabilities[best]), 3)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({
+                "vocabulary": self.vocabulary,
+                "idf": self.idf.tolist(),
+                "labels": self.labels,
+                "centroids": self.centroids.tolist(),
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["vocabulary"], data["idf"], data["labels"], data["centroids"])
+
+
+_model_lock = threading.Lock()
+_model = None
+_model_mtime = None
+
+
+def get_local_model():
+    """
+    The trained model from LOCAL_CLASSIFIER_PATH, reloaded when the file changes.
+    None until `manage.py train_classifier` has been run.
+    """
+    global _model, _model_mtime
+    path = settings.LOCAL_CLASSIFIER_PATH
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    if _model is None or mtime != _model_mtime:
+        with _model_lock:
+            if _model is None or mtime != _model_mtime:
+                _model = TfidfCentroidClassifier.load(path)
+                _model_mtime = mtime
+    return _model
+
+
+def classify_text_locally(text):
+    """
+    First-tier classification without any network call. Returns (document_type, confidence);
+    callers escalate to the LLM when confidence is below LOCAL_CLASSIFIER_MIN_CONFIDENCE.
+    """
+    keyword_type, keyword_confidence = keyword_classify(text)
+
+    model = get_local_model()
+    if model is None:
+        return keyword_type, keyword_confidence
+
+    model_type, model_confidence = model.predict(text)
+    if model_type == keyword_type:
+        return model_type, round(1 - (1 - model_confidence) * (1 - keyword_confidence), 3)
+
+    # The tiers disagree: keep the stronger one, discounted by the other's confidence
+    if model_confidence >= keyword_confidence:
+        return model_type, round(model_confidence - keyword_confidence / 2, 3)
+    return keyword_type, round(keyword_confidence - model_confidence / 2, 3)
@@ -0,0 +1,295 @@
+import json
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+
+import requests
+
+from .cache import content_hash
+from .classifier import keyword_classify
+
+# --- API Tokens ---
+HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/facebook/bart-large-mnli"
+HUGGINGFACE_API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# What a prompt is for, so stand-ins can answer without parsing the prompt wording
+TASK_PAGE_ANALYSIS = "page_analysis"
+TASK_CLASSIFY_PAGES = "classify_pages"
+TASK_EXTRACT_FIELDS = "extract_fields"
+TASK_ZERO_SHOT = "zero_shot"
+
+
+class LLMBackendError(Exception):
+    """
+    A backend answered with an error status. `code` is the HTTP status, like the
+    google.api_core errors, so the retry policy treats both the same way.
+    """
+    def __init__(self, code, message=""):
+        super().__init__(f"{code} {message}".strip())
+        self.code = code
+
+
+class LLMBackend(ABC):
+    """
+    Everything the app asks of a language model. generate() returns the raw response text
+    (JSON for our prompts); zero_shot() returns {"labels": [...], "scores": [...]}, best first.
+    """
+    name = "base"
+    # Only real model output belongs in the LLM response cache
+    cacheable = False
+
+    @abstractmethod
+    def generate(self, task, model_name, prompt, generation_config, timeout):
+        ...
+
+    @abstractmethod
+    def zero_shot(self, text, candidate_labels, timeout):
+        ...
+
+    def warm_up(self):
+        pass
+
+
+class ProviderBackend(LLMBackend):
+    """Gemini for prompts, the HuggingFace inference API for zero-shot classification."""
+    name = "gemini"
+    cacheable = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+
+    def _genai(self):
+        import google.generativeai as genai
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                    self._configured = True
+        return genai
+
+    def generate(self, task, model_name, prompt, generation_config, timeout):
+        response = self._genai().GenerativeModel(model_name).generate_content(
+            prompt, generation_config=generation_config, request_options={"timeout": timeout}
+        )
+        return response.text if response else ""
+
+    def zero_shot(self, text, candidate_labels, timeout):
+        response = requests.post(
+            HUGGINGFACE_API_URL,
+            headers={"Authorization": f"Bearer {HUGGINGFACE_API_TOKEN}"},
+            json={"inputs": text, "parameters": {"candidate_labels": candidate_labels}},
+            timeout=timeout,
+        )
+        return response.json()
+
+    def warm_up(self):
+        self._genai()
+
+
+class HTTPBackend(LLMBackend):
+    """Talks to the `manage.py llm_standin` server (or anything speaking the same JSON)."""
+    name = "http"
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def _post(self, path, payload, timeout):
+        response = requests.post(f"{self.base_url}{path}", json=payload, timeout=timeout)
+        if response.status_code != 200:
+            raise LLMBackendError(response.status_code, response.text[:200])
+        return response.json()
+
+    def generate(self, task, model_name, prompt, generation_config, timeout):
+        payload = {"task": task, "model": model_name, "prompt": prompt, "generation_config": generation_config}
+        return self._post("/v1/generate", payload, timeout)["text"]
+
+    def zero_shot(self, text, candidate_labels, timeout):
+        return self._post("/v1/zero-shot", {"text": text, "candidate_labels": candidate_labels}, timeout)
+
+
+# ---------- Canned Answers ----------
+
+# Types handed out when a page has no recognisable keywords (the old TESTING_MODE list)
+DUMMY_DOCUMENT_TYPES = [
+    "ID Proof(Passport, Driving License)",
+    "Bank Statement",
+    "Contract of Employment",
+    "Contract of Employment",
+    "P60",
+    "Payslip"
+]
+
+CANNED_FIELDS = {
+    "Full Name": "John Doe",
+    "Employee Name": "John Doe",
+    "Employer Name": "ACME Ltd",
+    "Salary Amount": "5000",
+}
+
+_PAGE_BLOCK_RE = re.compile(r'### Page (\d+)\n"""\n(.*?)\n"""', re.DOTALL)
+
+
+def canned_document_type(text):
+    document_type, confidence = keyword_classify(text)
+    if confidence:
+        return document_type
+    return DUMMY_DOCUMENT_TYPES[int(content_hash(text)[:8], 16) % len(DUMMY_DOCUMENT_TYPES)]
+
+
+def canned_response(task, prompt):
+    """
+    Plausible, well-formed answer to one of our prompts, derived from the prompt text alone
+    so the same input always gets the same answer.
+    """
+    if task == TASK_CLASSIFY_PAGES:
+        pages = [{"index": int(idx), "document_type": canned_document_type(text)}
+                 for idx, text in _PAGE_BLOCK_RE.findall(prompt)]
+        return json.dumps({"pages": pages})
+    if task == TASK_EXTRACT_FIELDS:
+        return json.dumps(CANNED_FIELDS)
+    return json.dumps({
+        "document_type": canned_document_type(prompt.rsplit("Document Text:", 1)[-1]),
+        "extracted_fields": CANNED_FIELDS,
+        "missing_fields": [],
+        "confidence_scores": {field: 0.9 for field in CANNED_FIELDS},
+    })
+
+
+def canned_zero_shot(text, candidate_labels):
+    best = canned_document_type(text).lower()
+    labels = sorted(candidate_labels, key=lambda label: label.lower().split()[0] not in best)
+    return {"labels": labels, "scores": [round(1 / (rank + 1), 3) for rank in range(len(labels))]}
+
+
+class CannedBackend(LLMBackend):
+    """Instant canned answers, no network (replaces the old TESTING_MODE switch)."""
+    name = "canned"
+
+    def generate(self, task, model_name, prompt, generation_config, timeout):
+        return canned_response(task, prompt)
+
+    def zero_shot(self, text, candidate_labels, timeout):
+        return canned_zero_shot(text, candidate_labels)
+
+
+# ---------- Record / Replay ----------
+
+def recording_key(task, model_name, prompt):
+    return content_hash(task, model_name, prompt)
+
+
+def zero_shot_recording_key(text, candidate_labels):
+    return content_hash(TASK_ZERO_SHOT, text, *candidate_labels)
+
+
+class ResponseRecording:
+    """
+    Append-only JSON-lines file of real responses keyed by task, model and prompt hash.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry["key"]] = entry["response"]
+        return entries
+
+    def get(self, key):
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            return self._entries.get(key)
+
+    def add(self, key, task, model_name, response):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "task": task, "model": model_name, "response": response}) + "\n")
+            if self._entries is not None:
+                self._entries[key] = response
+
+    def __len__(self):
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            return len(self._entries)
+
+
+class RecordingBackend(LLMBackend):
+    """Passes calls to `inner` and keeps every successful answer in a ResponseRecording."""
+    def __init__(self, inner, recording):
+        self.inner = inner
+        self.recording = recording
+        self.name = f"{inner.name}+record"
+        self.cacheable = inner.cacheable
+
+    def generate(self, task, model_name, prompt, generation_config, timeout):
+        text = self.inner.generate(task, model_name, prompt, generation_config, timeout)
+        self.recording.add(recording_key(task, model_name, prompt), task, model_name, text)
+        return text
+
+    def zero_shot(self, text, candidate_labels, timeout):
+        result = self.inner.zero_shot(text, candidate_labels, timeout)
+        self.recording.add(zero_shot_recording_key(text, candidate_labels), TASK_ZERO_SHOT, None, result)
+        return result
+
+    def warm_up(self):
+        self.inner.warm_up()
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Answers from a ResponseRecording. Unrecorded prompts get a canned answer, or a 404
+    when `strict`.
+    """
+    name = "replay"
+
+    def __init__(self, recording, strict=False):
+        self.recording = recording
+        self.strict = strict
+
+    def _lookup(self, key):
+        response = self.recording.get(key)
+        if response is None and self.strict:
+            raise LLMBackendError(404, "no recorded response")
+        return response
+
+    def generate(self, task, model_name, prompt, generation_config, timeout):
+        response = self._lookup(recording_key(task, model_name, prompt))
+        return canned_response(task, prompt) if response is None else response
+
+    def zero_shot(self, text, candidate_labels, timeout):
+        response = self._lookup(zero_shot_recording_key(text, candidate_labels))
+        return canned_zero_shot(text, candidate_labels) if response is None else response
+
+
+def build_llm_backend(name, url=None, record_path=None, replay_path=None):
+    """
+    Backend for LLM_BACKEND: "gemini" (production), "http" (stand-in server at `url`),
+    "replay" (answers recorded at `replay_path`) or "canned". With `record_path`, every
+    answer the backend gives is also appended there for later replay.
+    """
+    if name == "gemini":
+        backend = ProviderBackend()
+    elif name == "http":
+        backend = HTTPBackend(url)
+    elif name == "replay":
+        backend = ReplayBackend(ResponseRecording(replay_path))
+    elif name == "canned":
+        backend = CannedBackend()
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}")
+
+    if record_path:
+        backend = RecordingBackend(backend, ResponseRecording(record_path))
+    return backend
@@ -0,0 +1,59 @@
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from documents.utils import iter_rendered_pages, is_blurry, is_blank, compute_quality_metrics
+
+
+def _synthetic_page(height=3508, width=2480):
+    """A4 at 300 dpi: white page with dark text-like bars, left half out of focus."""
+    rng = np.random.default_rng(0)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    for top in range(200, height - 200, 60):
+        mask = rng.random(width - 400) > 0.4
+        image[top:top + 24, 200:width - 200][:, mask] = 20
+    image[:, : width // 2] = cv2.GaussianBlur(image[:, : width // 2], (31, 31), 0)
+    return image
+
+
+class Command(BaseCommand):
+    help = "Compare the legacy is_blurry/is_blank checks with the fused compute_quality_metrics pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument("pdf", nargs="?", help="PDF to benchmark on (defaults to a synthetic A4 page).")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options["pdf"]:
+            # Copy out of the pixmaps so the rasters outlive the render loop
+            images = [image.copy() for pix, image in iter_rendered_pages(options["pdf"], dpi=300)]
+        else:
+            images = [_synthetic_page()]
+
+        repeat = options["repeat"]
+
+        def legacy(image):
+            bgr = image[:, :, ::-1].copy()
+            return is_blurry(bgr), is_blank(bgr)
+
+        timings = {}
+        for name, func in [("legacy", legacy), ("fused", compute_quality_metrics)]:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for image in images:
+                    func(image)
+            timings[name] = (time.perf_counter() - start) * 1000 / (repeat * len(images))
+            self.stdout.write(f"{name:>7}: {timings[name]:8.1f} ms/page")
+
+        self.stdout.write(f"speedup: {timings['legacy'] / timings['fused']:.1f}x over {len(images)} page(s) x {repeat}")
+
+        for idx, image in enumerate(images, start=1):
+            (blurry, blur_score), (blank, blank_score) = legacy(image)
+            fused = compute_quality_metrics(image)
+            self.stdout.write(
+                f"page {idx}: legacy blur={blur_score:.1f} blurry={blurry} blank={blank_score:.3f} | "
+                f"fused blur={fused['blur_score']:.1f} blurry={fused['blurry']} blank={fused['blank_score']:.3f} "
+                f"blurry_tiles={fused['blurry_tile_ratio']:.2f}"
+            )
@@ -0,0 +1,23 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from documents.utils import get_ocr_cache, get_llm_cache, get_report_cache
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters and size of the on-disk result caches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="Empty the caches and reset their counters.")
+
+    def handle(self, *args, **options):
+        caches = {"ocr": get_ocr_cache(), "llm": get_llm_cache(), "reports": get_report_cache()}
+
+        for name, cache in caches.items():
+            if cache is None:
+                self.stdout.write(f"{name}: disabled")
+                continue
+            if options["clear"]:
+                cache.clear()
+            self.stdout.write(f"{name}: {json.dumps(cache.stats())}")
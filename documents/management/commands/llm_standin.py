@@ -0,0 +1,172 @@
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.llm_backends import (
+    ResponseRecording,
+    canned_response,
+    canned_zero_shot,
+    recording_key,
+    zero_shot_recording_key,
+)
+
+
+def parse_latency(spec):
+    """
+    "fixed:S", "uniform:LOW,HIGH", "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA" (seconds)
+    -> a function drawing one latency from a random.Random.
+    """
+    kind, _, args = spec.partition(":")
+    try:
+        params = [float(arg) for arg in args.split(",")] if args else []
+    except ValueError:
+        raise CommandError(f"Bad latency spec {spec!r}")
+
+    if kind == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(*params)
+    if kind == "normal" and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(*params))
+    if kind == "lognormal" and len(params) == 2:
+        median, sigma = params
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise CommandError(f"Bad latency spec {spec!r}")
+
+
+class StandIn:
+    """The stand-in's behaviour, shared by every request thread."""
+    def __init__(self, latency, error_rate, rate_limit_rate, requests_per_minute, recording, seed):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.recording = recording
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.counts = {"ok": 0, "error": 0, "rate_limited": 0, "replayed": 0}
+
+    def admit(self):
+        """(status, delay) for the next request: 200, 429 or 500, after a sampled latency."""
+        with self.lock:
+            now = time.monotonic()
+            delay = self.latency(self.rng)
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+
+            if self.requests_per_minute and len(self.recent) >= self.requests_per_minute:
+                status = 429
+            elif self.rng.random() < self.rate_limit_rate:
+                status = 429
+            elif self.rng.random() < self.error_rate:
+                status = 500
+            else:
+                status = 200
+                self.recent.append(now)
+            self.counts[{200: "ok", 429: "rate_limited", 500: "error"}[status]] += 1
+        # Rejections come back fast, like a real gateway
+        return status, delay if status == 200 else min(delay, 0.05)
+
+    def answer(self, path, payload):
+        if path == "/v1/generate":
+            key = recording_key(payload["task"], payload.get("model"), payload["prompt"])
+            replayed = self.recording.get(key) if self.recording is not None else None
+            text = replayed if replayed is not None else canned_response(payload["task"], payload["prompt"])
+            body = {"text": text}
+        else:
+            key = zero_shot_recording_key(payload["text"], payload["candidate_labels"])
+            replayed = self.recording.get(key) if self.recording is not None else None
+            body = replayed if replayed is not None else canned_zero_shot(payload["text"], payload["candidate_labels"])
+        if replayed is not None:
+            with self.lock:
+                self.counts["replayed"] += 1
+        return body
+
+
+def make_handler(standin, verbose):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, headers=()):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with standin.lock:
+                    self._send(200, dict(standin.counts))
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path not in ("/v1/generate", "/v1/zero-shot"):
+                self._send(404, {"error": "not found"})
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+            status, delay = standin.admit()
+            time.sleep(delay)
+            if status == 429:
+                self._send(429, {"error": {"code": 429, "message": "Resource has been exhausted"}}, [("Retry-After", "1")])
+            elif status == 500:
+                self._send(500, {"error": {"code": 500, "message": "Internal error"}})
+            else:
+                self._send(200, standin.answer(self.path, payload))
+
+        def log_message(self, format, *args):
+            if verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = ("Run a local HTTP stand-in for the LLM providers (use with LLM_BACKEND=http) with "
+            "configurable latency, error and rate-limit behaviour, answering from a recording or canned data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", default="lognormal:1.5,0.5",
+                            help='Response time distribution, e.g. "fixed:0.5", "uniform:0.2,2", '
+                                 '"normal:1,0.3", "lognormal:1.5,0.5" (median, sigma).')
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500.")
+        parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                            help="Share of requests answered with a 429 regardless of load.")
+        parser.add_argument("--rpm", type=int, default=0,
+                            help="Answer 429 once this many requests succeeded in the last minute (0 = no quota).")
+        parser.add_argument("--replay", help="JSON-lines recording (LLM_RECORD_PATH output) to answer from.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--verbose", action="store_true", help="Log every request.")
+
+    def handle(self, *args, **options):
+        standin = StandIn(
+            latency=parse_latency(options["latency"]),
+            error_rate=options["error_rate"],
+            rate_limit_rate=options["rate_limit_rate"],
+            requests_per_minute=options["rpm"],
+            recording=ResponseRecording(options["replay"]) if options["replay"] else None,
+            seed=options["seed"],
+        )
+        server = ThreadingHTTPServer((options["host"], options["port"]), make_handler(standin, options["verbose"]))
+        replaying = f", replaying {len(standin.recording)} responses" if standin.recording is not None else ""
+        self.stdout.write(f"🧪 LLM stand-in on http://{options['host']}:{options['port']} "
+                          f"(latency {options['latency']}{replaying}); GET /stats for counters")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served: {json.dumps(standin.counts)}")
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from django.conf import settings
+
+from documents.processing import claim_next_job, run_job, requeue_stale_jobs
+from documents.utils import warm_up_engines
+
+
+class Command(BaseCommand):
+    help = "Run the document ingestion worker: pick up queued uploads and process them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+        parser.add_argument("--poll-interval", type=float, default=2.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--stale-after", type=int, default=None,
+                            help="Requeue running jobs older than this many seconds (0 disables; "
+                                 "default twice DOCUMENT_TIME_BUDGET).")
+        parser.add_argument("--requeue-interval", type=float, default=60.0,
+                            help="Seconds between checks for stale jobs while the worker runs.")
+        parser.add_argument("--no-warmup", action="store_true",
+                            help="Load OCR/LLM engines on the first job instead of at startup.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("🚚 Document worker started")
+
+        if not options["no_warmup"]:
+            # With a process pool the OCR workers load their own readers; this process only OCRs inline
+            warm_up_engines(ocr=settings.OCR_WORKERS <= 1, llm=True)
+
+        stale_after = options["stale_after"]
+        if stale_after is None:
+            # Jobs give up at the deadline, so one running far past it lost its worker
+            stale_after = settings.DOCUMENT_TIME_BUDGET * 2
+        next_requeue = 0.0
+
+        while True:
+            # Checked while running too, not just at startup: a job orphaned by a restart is
+            # still too young to requeue when the new worker starts
+            if stale_after and time.monotonic() >= next_requeue:
+                requeued = requeue_stale_jobs(stale_after)
+                if requeued:
+                    self.stdout.write(f"♻️  Requeued {requeued} stale job(s)")
+                next_requeue = time.monotonic() + options["requeue_interval"]
+
+            job = claim_next_job()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            self.stdout.write(f"📥 Job {job.id}: processing upload {job.document_id} (attempt {job.attempts})")
+            job = run_job(job)
+            self.stdout.write(f"📤 Job {job.id}: {job.status}")
+
+        self.stdout.write("✅ Queue drained")
@@ -0,0 +1,40 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.classifier import DOCUMENT_KEYWORDS, TfidfCentroidClassifier
+from documents.models import PageAnalysis
+
+
+class Command(BaseCommand):
+    help = "Train the local page classifier from stored, LLM-labelled PageAnalysis text."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-pages", type=int, default=20,
+                            help="Refuse to train on fewer labelled pages than this.")
+        parser.add_argument("--output", default=None, help="Defaults to LOCAL_CLASSIFIER_PATH.")
+
+    def handle(self, *args, **options):
+        # Only LLM labels: training on the local tier's own answers would reinforce its mistakes
+        rows = (PageAnalysis.objects
+                .filter(classification_source=PageAnalysis.CLASSIFIED_BY_LLM,
+                        document_type__in=list(DOCUMENT_KEYWORDS))
+                .exclude(ocr_text__isnull=True).exclude(ocr_text="")
+                .values_list("ocr_text", "document_type"))
+        texts, labels = [], []
+        for text, label in rows.iterator():
+            texts.append(text)
+            labels.append(label)
+
+        if len(texts) < options["min_pages"]:
+            raise CommandError(f"Only {len(texts)} labelled pages available (need {options['min_pages']}).")
+
+        model = TfidfCentroidClassifier.train(texts, labels)
+        output = options["output"] or settings.LOCAL_CLASSIFIER_PATH
+        model.save(output)
+
+        correct = sum(1 for text, label in zip(texts, labels) if model.predict(text)[0] == label)
+        self.stdout.write(f"📊 Label counts: {dict(Counter(labels))}")
+        self.stdout.write(f"✅ Trained on {len(texts)} pages, {len(model.vocabulary)} terms -> {output}")
+        self.stdout.write(f"   Training accuracy: {correct / len(texts):.1%}")
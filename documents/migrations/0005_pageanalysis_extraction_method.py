@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='extraction_method',
+            field=models.CharField(choices=[('ocr', 'OCR'), ('text_layer', 'Embedded text layer')], default='ocr', max_length=20),
+        ),
+    ]
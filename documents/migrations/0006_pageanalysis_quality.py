@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_pageanalysis_extraction_method'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='blank_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='blur_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='is_blank',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='is_blurry',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+    ]
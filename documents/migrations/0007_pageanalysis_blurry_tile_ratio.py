@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_pageanalysis_quality'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='blurry_tile_ratio',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
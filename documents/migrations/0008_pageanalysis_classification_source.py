@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_pageanalysis_blurry_tile_ratio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='classification_confidence',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='classification_source',
+            field=models.CharField(choices=[('llm', 'LLM'), ('local', 'Local classifier'), ('testing', 'Testing mode')], default='llm', max_length=20),
+        ),
+    ]
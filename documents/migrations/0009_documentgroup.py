@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 08:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_pageanalysis_classification_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(max_length=100)),
+                ('first_page', models.IntegerField()),
+                ('last_page', models.IntegerField()),
+                ('page_count', models.IntegerField()),
+                ('extracted_fields', models.JSONField(blank=True, null=True)),
+                ('confidence_scores', models.JSONField(blank=True, null=True)),
+                ('missing_fields', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='groups', to='documents.customerdocumentupload')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pageanalysis',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='documents.documentgroup'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def pages_to_groups(apps, schema_editor):
+    """
+    One DocumentGroup per (upload, document type), holding the analysis that processing
+    copied onto each of the group's pages.
+    """
+    DocumentGroup = apps.get_model('documents', 'DocumentGroup')
+    PageAnalysis = apps.get_model('documents', 'PageAnalysis')
+
+    pages_by_group = defaultdict(list)
+    pages = PageAnalysis.objects.filter(group__isnull=True).only(
+        'id', 'document_id', 'document_type', 'page_number',
+        'extracted_fields', 'confidence_scores', 'missing_fields',
+    ).order_by('document_id', 'page_number')
+    for page in pages.iterator():
+        pages_by_group[(page.document_id, page.document_type)].append(page)
+
+    for (document_id, document_type), group_pages in pages_by_group.items():
+        source = next((page for page in group_pages if page.extracted_fields), group_pages[0])
+        group = DocumentGroup.objects.create(
+            document_id=document_id,
+            document_type=document_type,
+            first_page=group_pages[0].page_number,
+            last_page=group_pages[-1].page_number,
+            page_count=len(group_pages),
+            extracted_fields=source.extracted_fields,
+            confidence_scores=source.confidence_scores,
+            missing_fields=source.missing_fields,
+        )
+        PageAnalysis.objects.filter(id__in=[page.id for page in group_pages]).update(group=group)
+
+
+def groups_to_pages(apps, schema_editor):
+    DocumentGroup = apps.get_model('documents', 'DocumentGroup')
+    PageAnalysis = apps.get_model('documents', 'PageAnalysis')
+
+    for group in DocumentGroup.objects.iterator():
+        PageAnalysis.objects.filter(group=group).update(
+            extracted_fields=group.extracted_fields,
+            confidence_scores=group.confidence_scores,
+            missing_fields=group.missing_fields,
+            group=None,
+        )
+    DocumentGroup.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_documentgroup'),
+    ]
+
+    operations = [
+        migrations.RunPython(pages_to_groups, groups_to_pages),
+    ]
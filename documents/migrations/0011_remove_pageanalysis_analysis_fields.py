@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 08:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_pageanalysis_groups_data'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='pageanalysis',
+            name='confidence_scores',
+        ),
+        migrations.RemoveField(
+            model_name='pageanalysis',
+            name='extracted_fields',
+        ),
+        migrations.RemoveField(
+            model_name='pageanalysis',
+            name='missing_fields',
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+def summarise_processed_uploads(apps, schema_editor):
+    """Fill the new columns for uploads processed before they existed."""
+    CustomerDocumentUpload = apps.get_model('documents', 'CustomerDocumentUpload')
+    DocumentGroup = apps.get_model('documents', 'DocumentGroup')
+
+    for upload in CustomerDocumentUpload.objects.filter(processed=True).iterator():
+        groups = list(DocumentGroup.objects.filter(document_id=upload.id).order_by('id'))
+        upload.extracted_data = {
+            group.document_type or f"unknown_group_{group.first_page}": group.extracted_fields or {}
+            for group in groups
+        }
+        upload.main_document_type = groups[0].document_type if groups else None
+        upload.save(update_fields=['extracted_data', 'main_document_type'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_remove_pageanalysis_analysis_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerdocumentupload',
+            name='extracted_data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customerdocumentupload',
+            name='main_document_type',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(summarise_processed_uploads, migrations.RunPython.noop),
+    ]
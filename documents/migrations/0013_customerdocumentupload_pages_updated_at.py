@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_customerdocumentupload_extracted_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerdocumentupload',
+            name='pages_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
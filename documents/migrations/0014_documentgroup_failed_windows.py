@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_customerdocumentupload_pages_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentgroup',
+            name='failed_windows',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -16,20 +16,98 @@ class CustomerDocumentUpload(models.Model):
     id_proof_file = models.FileField(upload_to='uploads/id_proofs/', null=True, blank=True)
     p60_file = models.FileField(upload_to='uploads/p60_forms/', null=True, blank=True)
 
+    # Written with the groups at the end of processing, so the report endpoints read one row
+    # ({document_type: extracted_fields}) instead of rebuilding it from the pages
+    extracted_data = models.JSONField(null=True, blank=True)
+    main_document_type = models.CharField(max_length=100, null=True, blank=True)
+    # Bumped whenever the pages (or their stored quality metrics) are rewritten; cached
+    # reports and their ETags are keyed on it
+    pages_updated_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         return f"{self.user.username} - Uploaded on {self.uploaded_at}"
-    
+
+class DocumentGroup(models.Model):
+    """
+    The pages of one upload that share a document type, holding the single analysis they
+    were given (pages link here rather than each carrying a copy).
+    """
+    document = models.ForeignKey('CustomerDocumentUpload', on_delete=models.CASCADE, related_name="groups")
+    document_type = models.CharField(max_length=100)
+    first_page = models.IntegerField()
+    last_page = models.IntegerField()
+    page_count = models.IntegerField()
+    extracted_fields = models.JSONField(null=True, blank=True)
+    confidence_scores = models.JSONField(null=True, blank=True)
+    missing_fields = models.JSONField(null=True, blank=True)
+    # [first_page, last_page] of map-reduce windows that returned nothing; when non-empty the
+    # fields above are partial (monthly totals leave those pages out)
+    failed_windows = models.JSONField(default=list, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.document_type} pages {self.first_page}-{self.last_page} (DocID: {self.document_id})"
+
 class PageAnalysis(models.Model):
+    EXTRACTION_OCR = "ocr"
+    EXTRACTION_TEXT_LAYER = "text_layer"
+    EXTRACTION_CHOICES = [
+        (EXTRACTION_OCR, "OCR"),
+        (EXTRACTION_TEXT_LAYER, "Embedded text layer"),
+    ]
+
+    CLASSIFIED_BY_LLM = "llm"
+    CLASSIFIED_LOCALLY = "local"
+    CLASSIFIED_BY_TESTING_MODE = "testing"
+    CLASSIFICATION_SOURCE_CHOICES = [
+        (CLASSIFIED_BY_LLM, "LLM"),
+        (CLASSIFIED_LOCALLY, "Local classifier"),
+        (CLASSIFIED_BY_TESTING_MODE, "Testing mode"),
+    ]
+
     document = models.ForeignKey('CustomerDocumentUpload', on_delete=models.CASCADE, related_name="pages")
+    group = models.ForeignKey('DocumentGroup', on_delete=models.CASCADE, related_name="pages", null=True, blank=True)
     page_number = models.IntegerField()
     page_path = models.CharField(max_length=500)
     document_type = models.CharField(max_length=100)
-    extracted_fields = models.JSONField(null=True, blank=True)
-    confidence_scores = models.JSONField(null=True, blank=True)
-    missing_fields = models.JSONField(null=True, blank=True)
     ocr_text = models.TextField(null=True, blank=True)
+    extraction_method = models.CharField(max_length=20, choices=EXTRACTION_CHOICES, default=EXTRACTION_OCR)
+    classification_source = models.CharField(max_length=20, choices=CLASSIFICATION_SOURCE_CHOICES, default=CLASSIFIED_BY_LLM)
+    classification_confidence = models.FloatField(null=True, blank=True)
+
+    # Image quality, computed once at ingest from the page raster
+    is_blurry = models.BooleanField(null=True, blank=True)
+    blur_score = models.FloatField(null=True, blank=True)
+    is_blank = models.BooleanField(null=True, blank=True)
+    blank_score = models.FloatField(null=True, blank=True)
+    blurry_tile_ratio = models.FloatField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Page {self.page_number} - {self.document_type} (DocID: {self.document.id})"
+
+class ProcessingJob(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    document = models.ForeignKey('CustomerDocumentUpload', on_delete=models.CASCADE, related_name="jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"Page {self.page_number} - {self.document_type} (DocID: {self.document.id})"
\ No newline at end of file
+        return f"Job {self.id} - {self.status} (DocID: {self.document_id})"
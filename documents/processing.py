@@ -0,0 +1,395 @@
+import os
+import time
+import traceback
+from collections import defaultdict
+from functools import partial
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .classifier import classify_text_locally
+from .models import DocumentGroup, PageAnalysis, ProcessingJob
+from .utils import (
+    iter_split_pdf_pages,
+    extract_page,
+    llm_full_page_analysis,
+    llm_classify_pages_batch,
+    build_classification_batches,
+    merge_page_analyses,
+    reduce_window_analyses,
+    conform_to_schema,
+    llm_map,
+    get_llm_backend,
+    compact_page_text,
+    compact_group_texts,
+    estimate_tokens,
+    PipelineStage,
+    run_pipeline,
+    DOCUMENT_TYPE_FIELDS,
+    MONTHLY_FIELDS,
+)
+
+def normalize_document_type(doc_type):
+    """
+    Normalize document type variations to a standard.
+    """
+    doc_type = doc_type.lower()
+    if "contract of employement" in doc_type or "contract of employment" in doc_type:
+        return "Contract of Employment"
+    if "id proof" in doc_type or "passport" in doc_type or "driving license" in doc_type:
+        return "ID Proof(Passport, Driving License)"
+    if "bank statement" in doc_type:
+        return "Bank Statement"
+    if "p60" in doc_type:
+        return "P60"
+    if "payslip" in doc_type:
+        return "Payslip"
+    return doc_type.title()
+
+def _ocr_stage(numbered_page):
+    page_number, page_path = numbered_page
+    result = extract_page(page_path)
+    return {
+        "page_number": page_number,
+        "page_path": os.path.relpath(page_path, settings.MEDIA_ROOT),
+        "ocr_text": result["text"],
+        # What LLM prompts see; ocr_text is stored untouched
+        "prompt_text": compact_page_text(result["text"]) if settings.PROMPT_COMPACTION_ENABLED else result["text"],
+        "extraction_method": result["extraction_method"],
+        "quality": result["quality"],
+    }
+
+def _local_classify_stage(page):
+    """
+    First tier: the local classifier. Pages it can't settle confidently keep document_type
+    None for the LLM stage.
+    """
+    page["analysis"] = None
+    page["document_type"] = None
+    page["classification_confidence"] = None
+    if settings.LOCAL_CLASSIFIER_ENABLED:
+        document_type, confidence = classify_text_locally(page["ocr_text"])
+        if confidence >= settings.LOCAL_CLASSIFIER_MIN_CONFIDENCE:
+            page["document_type"] = normalize_document_type(document_type)
+            page["classification_source"] = PageAnalysis.CLASSIFIED_LOCALLY
+            page["classification_confidence"] = confidence
+    return page
+
+def _llm_classification_source():
+    """
+    Labels from the canned/replay/http stand-ins are marked as testing, so train_classifier
+    (which learns from LLM labels only) never picks them up.
+    """
+    return PageAnalysis.CLASSIFIED_BY_LLM if get_llm_backend().cacheable else PageAnalysis.CLASSIFIED_BY_TESTING_MODE
+
+def _classify_with_full_analysis(page, deadline=None):
+    analysis = llm_full_page_analysis(page["prompt_text"], deadline=deadline)
+    page["document_type"] = normalize_document_type(analysis.get('document_type', 'unknown'))
+    page["classification_source"] = _llm_classification_source()
+    # Kept so the group step can reuse the extraction instead of asking again
+    page["analysis"] = analysis or None
+
+def _llm_classify_stage(pages, deadline=None):
+    """
+    Second tier, batched: pages the local tier left undecided are classified several per
+    prompt. A lone page gets the full analysis instead, which its group can then reuse.
+    """
+    pending = [page for page in pages if page["document_type"] is None]
+    for batch in build_classification_batches([page["prompt_text"] for page in pending]):
+        batch_pages = [pending[idx] for idx in batch]
+        if len(batch_pages) == 1:
+            _classify_with_full_analysis(batch_pages[0], deadline)
+            continue
+
+        print(f"📦 Classifying pages {[page['page_number'] for page in batch_pages]} in one LLM call")
+        document_types = llm_classify_pages_batch([page["prompt_text"] for page in batch_pages], deadline=deadline)
+        for page, document_type in zip(batch_pages, document_types):
+            if document_type is None:
+                _classify_with_full_analysis(page, deadline)
+                continue
+            page["document_type"] = normalize_document_type(document_type)
+            page["classification_source"] = _llm_classification_source()
+
+    for page in pages:
+        print(f"📄 Page {page['page_number']} ({os.path.basename(page['page_path'])}, {page['extraction_method']}): "
+              f"Classified as ➡️  [{page['document_type']}] by {page['classification_source']}")
+    return pages
+
+def _compact_group(pages):
+    """
+    Set each page's group_text (its prompt text with the group's running headers/footers
+    removed) and return the (raw, compacted) token estimates for the group.
+    """
+    raw_texts = [page["ocr_text"] for page in pages]
+    group_texts = compact_group_texts(raw_texts) if settings.PROMPT_COMPACTION_ENABLED else raw_texts
+    for page, text in zip(pages, group_texts):
+        page["group_text"] = text
+    return sum(estimate_tokens(text) for text in raw_texts), sum(estimate_tokens(text) for text in group_texts)
+
+def analyse_document_group(document_type, pages, deadline=None):
+    """
+    Group-level analysis for pages sharing a document type. A single page reuses its own
+    classification analysis; several pages are merged deterministically and only sent back
+    to the LLM as one combined text (with the type's own prompt) when their fields conflict
+    or some are still missing.
+    """
+    page_analyses = [page.get("analysis") for page in pages]
+    if all(page_analyses):
+        if len(pages) == 1:
+            print(f"♻️  {document_type}: reusing page analysis (no extra LLM call)")
+            return _conform(document_type, page_analyses[0])
+
+        merged, conflicts = merge_page_analyses(page_analyses)
+        merged = _conform(document_type, merged)
+        if not conflicts and not merged["missing_fields"]:
+            print(f"♻️  {document_type}: merged {len(pages)} page analyses (no extra LLM call)")
+            return merged
+        print(f"🔁 {document_type}: conflicts={conflicts} missing={merged['missing_fields']} -> group LLM call")
+
+    window_size = settings.EXTRACTION_WINDOW_PAGES
+    if window_size and len(pages) > window_size:
+        return _analyse_in_windows(document_type, pages, window_size, deadline)
+
+    # The type is settled by now, so the group gets the shorter prompt for just its fields
+    combined_text = "\n\n".join([p["group_text"] for p in pages])
+    return llm_full_page_analysis(combined_text, deadline=deadline, document_type=document_type)
+
+def _conform(document_type, analysis):
+    """
+    Page analyses come from the generic prompt, so a reused or merged one is given the
+    type's schema spelling and missing_fields, like a group call's answer.
+    """
+    if document_type in DOCUMENT_TYPE_FIELDS:
+        return conform_to_schema(document_type, analysis)
+    return analysis
+
+def _analyse_in_windows(document_type, pages, window_size, deadline):
+    """
+    Map-reduce for large groups: fixed-size page windows are analysed concurrently and
+    their results reduced into one analysis. A window that returns nothing doesn't fail the
+    group, but the result records it (see _mark_failed_windows).
+    """
+    windows = [pages[start:start + window_size] for start in range(0, len(pages), window_size)]
+    print(f"🧩 {document_type}: {len(pages)} pages -> {len(windows)} windows of up to {window_size}")
+
+    analyses = llm_map(
+        lambda window: llm_full_page_analysis(_window_text(window), deadline=deadline, document_type=document_type),
+        windows,
+    )
+    failed = [[window[0]["page_number"], window[-1]["page_number"]]
+              for window, analysis in zip(windows, analyses) if not analysis]
+    analyses = [analysis for analysis in analyses if analysis]
+
+    if analyses:
+        merged, conflicts = reduce_window_analyses(analyses)
+        if conflicts:
+            print(f"🔀 {document_type}: windows disagree on {conflicts}, kept the most confident values")
+    else:
+        merged = {"document_type": document_type, "extracted_fields": {}, "confidence_scores": {}, "missing_fields": []}
+
+    if failed:
+        print(f"⚠️  {document_type}: window(s) covering pages {failed} of {len(windows)} windows returned nothing")
+        _mark_failed_windows(document_type, merged, failed)
+    return merged
+
+def _window_text(window):
+    """
+    A window's prompt text. Its pages are compacted on their own rather than as part of the
+    whole group, so every window keeps one copy of the running headers (account holder,
+    statement period) that the group-wide pass leaves on the group's first page only.
+    """
+    raw_texts = [page["ocr_text"] for page in window]
+    texts = compact_group_texts(raw_texts) if settings.PROMPT_COMPACTION_ENABLED else raw_texts
+    return "\n\n".join(texts)
+
+def _mark_failed_windows(document_type, analysis, failed_windows):
+    """
+    Flag a reduced analysis as partial: its failed_windows are recorded, and the type's
+    fields nobody supplied plus every summed monthly field (short of the failed pages) are
+    listed as missing.
+    """
+    extracted = {field.strip().lower() for field in analysis["extracted_fields"]}
+    missing = list(analysis.get("missing_fields") or [])
+    listed = {str(field).strip().lower() for field in missing}
+
+    schema_fields = [name for name, hint in DOCUMENT_TYPE_FIELDS.get(document_type, [])]
+    incomplete = [name for name in schema_fields if name.lower() not in extracted]
+    incomplete += [field for field in analysis["extracted_fields"] if field.strip().lower() in MONTHLY_FIELDS]
+    for field in incomplete:
+        if field.lower() not in listed:
+            missing.append(field)
+            listed.add(field.lower())
+
+    analysis["missing_fields"] = missing
+    analysis["failed_windows"] = failed_windows
+
+def summarise_groups(groups):
+    """
+    {document_type: extracted_fields} across an upload's groups: the input every report
+    endpoint works from.
+    """
+    return {
+        group.document_type or f"unknown_group_{group.first_page}": group.extracted_fields or {}
+        for group in groups
+    }
+
+
+def process_document_upload(instance):
+    """
+    Split, OCR, classify and analyse every page of an upload, then mark it processed.
+    """
+    print("\n🛠️  === STARTING DOCUMENT PROCESSING ===\n")
+
+    original_pdf_path = instance.original_file.path
+    output_folder = os.path.join(settings.MEDIA_ROOT, 'uploads', 'splits', f"{instance.id}")
+    os.makedirs(output_folder, exist_ok=True)
+    # Every LLM call below is bounded by what is left of the upload's time budget
+    deadline = time.monotonic() + settings.DOCUMENT_TIME_BUDGET
+
+    # split -> OCR -> local classify -> batched LLM classify, overlapped page by page
+    split_pages = enumerate(iter_split_pdf_pages(original_pdf_path, output_folder), start=1)
+    page_data = run_pipeline(split_pages, [
+        PipelineStage("ocr", _ocr_stage, workers=settings.OCR_WORKERS),
+        PipelineStage("local-classify", _local_classify_stage),
+        PipelineStage("llm-classify", partial(_llm_classify_stage, deadline=deadline), workers=settings.LLM_WORKERS,
+                      batch_size=settings.LLM_CLASSIFY_BATCH_SIZE, batch_wait=settings.LLM_CLASSIFY_BATCH_WAIT),
+    ])
+
+    # Group pages by normalized document type
+    grouped_docs = defaultdict(list)
+    for page in page_data:
+        grouped_docs[page["document_type"]].append(page)
+
+    print("\n📚 === GROUPED DOCUMENTS SUMMARY ===")
+    raw_tokens = compact_tokens = 0
+    for doc_type, pages in grouped_docs.items():
+        page_names = [os.path.basename(p['page_path']) for p in pages]
+        print(f"✅ {doc_type}: {len(pages)} page(s) -> {page_names}")
+        group_raw, group_compact = _compact_group(pages)
+        raw_tokens += group_raw
+        compact_tokens += group_compact
+    if raw_tokens:
+        print(f"🗜️  Prompt text: ~{raw_tokens} -> ~{compact_tokens} tokens "
+              f"(saved ~{raw_tokens - compact_tokens}, {100 * (raw_tokens - compact_tokens) // raw_tokens}%)")
+    print("======================================\n")
+
+    # For each document type, reuse the per-page analyses where possible, else call LLM once;
+    # the groups are independent, so their LLM calls run side by side
+    analyses = llm_map(lambda group: analyse_document_group(*group, deadline=deadline), grouped_docs.items())
+
+    # One row per group holds its analysis; pages only point at it
+    groups, rows = [], []
+    for (document_type, pages), analysis in zip(grouped_docs.items(), analyses):
+        page_numbers = [page["page_number"] for page in pages]
+        group = DocumentGroup(
+            document=instance,
+            document_type=document_type,
+            first_page=min(page_numbers),
+            last_page=max(page_numbers),
+            page_count=len(pages),
+            extracted_fields=analysis.get('extracted_fields', {}),
+            confidence_scores=analysis.get('confidence_scores', {}),
+            missing_fields=analysis.get('missing_fields', []),
+            failed_windows=analysis.get('failed_windows', []),
+        )
+        groups.append(group)
+        for page in pages:
+            rows.append(PageAnalysis(
+                document=instance,
+                group=group,
+                page_number=page["page_number"],
+                page_path=page["page_path"],
+                document_type=document_type,
+                ocr_text=page["ocr_text"],
+                extraction_method=page["extraction_method"],
+                classification_source=page["classification_source"],
+                classification_confidence=page["classification_confidence"],
+                is_blurry=page["quality"]["blurry"],
+                blur_score=page["quality"]["blur_score"],
+                is_blank=page["quality"]["blank"],
+                blank_score=page["quality"]["blank_score"],
+                blurry_tile_ratio=page["quality"]["blurry_tile_ratio"],
+            ))
+
+    # Swap in the new rows and flip `processed` in one transaction, so readers see either the
+    # previous state or the complete result, never a half-written document
+    with transaction.atomic():
+        instance.groups.all().delete()
+        instance.pages.all().delete()
+        # A handful of groups per upload; saved one by one so every backend hands back their ids
+        for group in groups:
+            group.save()
+        PageAnalysis.objects.bulk_create(rows, batch_size=200)
+        instance.extracted_data = summarise_groups(groups)
+        instance.main_document_type = groups[0].document_type if groups else None
+        instance.pages_updated_at = timezone.now()
+        instance.processed = True
+        instance.save(update_fields=["extracted_data", "main_document_type", "pages_updated_at", "processed"])
+
+    print("\n✅ === UPLOAD PROCESSED AND SAVED SUCCESSFULLY ===\n")
+
+# ---------- Job Queue ----------
+
+def enqueue_document_upload(instance):
+    """
+    Queue an upload for the `process_uploads` worker and return the job.
+    """
+    return ProcessingJob.objects.create(document=instance)
+
+def claim_next_job():
+    """
+    Atomically move the oldest pending job to running. Returns None when the queue is empty.
+    """
+    while True:
+        job = ProcessingJob.objects.filter(status=ProcessingJob.STATUS_PENDING).order_by("created_at").first()
+        if job is None:
+            return None
+
+        # The status filter makes the UPDATE a compare-and-swap between competing workers
+        claimed = ProcessingJob.objects.filter(pk=job.pk, status=ProcessingJob.STATUS_PENDING).update(
+            status=ProcessingJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            attempts=job.attempts + 1,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+def run_job(job):
+    """
+    Process the upload behind a claimed job and record the outcome on the job.
+    """
+    try:
+        process_document_upload(job.document)
+        job.status = ProcessingJob.STATUS_DONE
+        job.error = None
+    except Exception as e:
+        traceback.print_exc()
+        job.status = ProcessingJob.STATUS_FAILED
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "finished_at"])
+    return job
+
+def requeue_stale_jobs(max_age_seconds, max_attempts=None):
+    """
+    Put running jobs whose worker died back in the queue. A job that has already used
+    `max_attempts` claims is failed instead, so an upload that kills its worker every time
+    can't keep the queue busy forever. Returns the number of jobs requeued.
+    """
+    max_attempts = settings.JOB_MAX_ATTEMPTS if max_attempts is None else max_attempts
+    cutoff = timezone.now() - timedelta(seconds=max_age_seconds)
+    stale = ProcessingJob.objects.filter(status=ProcessingJob.STATUS_RUNNING, started_at__lt=cutoff)
+
+    exhausted = stale.filter(attempts__gte=max_attempts).update(
+        status=ProcessingJob.STATUS_FAILED,
+        error=f"Worker lost on each of {max_attempts} attempt(s); giving up",
+        finished_at=timezone.now(),
+    )
+    if exhausted:
+        print(f"❌ Failed {exhausted} stale job(s) after {max_attempts} attempt(s)")
+
+    return stale.update(status=ProcessingJob.STATUS_PENDING)
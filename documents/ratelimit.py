@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class TokenBucketLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets kept in a SQLite file, so every thread
+    and every worker process on the host draws from the same provider quota.
+
+    acquire(tokens) blocks until one request and `tokens` tokens are available in both
+    buckets, or raises TimeoutError if that would take longer than `max_wait` seconds.
+    A limit of 0 disables that bucket.
+    """
+    def __init__(self, path, requests_per_minute, tokens_per_minute):
+        self.path = str(path)
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _try_take(self, conn, costs):
+        """Take `costs` from every bucket, or return how many seconds to wait for them."""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels, wait = {}, 0.0
+            for name, cost in costs.items():
+                capacity = self.limits[name]
+                row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60)
+                levels[name] = level
+                if level < cost:
+                    wait = max(wait, (cost - level) * 60 / capacity)
+
+            if not wait:
+                levels = {name: level - costs[name] for name, level in levels.items()}
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                [(name, level, now) for name, level in levels.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self, tokens=0, max_wait=None):
+        costs = {
+            # A single prompt larger than the whole minute's budget waits for a full bucket
+            name: min(cost, self.limits[name])
+            for name, cost in (("requests", 1), ("tokens", tokens))
+            if self.limits[name]
+        }
+        if not costs:
+            return 0.0
+
+        conn = self._connect()
+        waited = 0.0
+        while True:
+            wait = self._try_take(conn, costs)
+            if not wait:
+                break
+            if max_wait is not None and waited + wait > max_wait:
+                raise TimeoutError(f"LLM quota not available within {max_wait:.1f}s")
+            # Sleep in short steps: other processes may be refilling/draining the same buckets
+            wait = min(wait, 1.0)
+            time.sleep(wait)
+            waited += wait
+
+        if waited:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES ('waited_seconds', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (waited,),
+            )
+        return waited
+
+    def stats(self):
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        return {
+            "requests_per_minute": self.limits["requests"],
+            "tokens_per_minute": self.limits["tokens"],
+            "waited_seconds": round(counters.get("waited_seconds", 0.0), 3),
+        }
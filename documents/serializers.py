@@ -6,4 +6,5 @@ class CustomerDocumentUploadSerializer(serializers.ModelSerializer):
         model = CustomerDocumentUpload
         fields = '__all__'
         read_only_fields = ['user', 'uploaded_at', 'processed',
-                            'payslip_file', 'contract_file', 'bank_statement_file', 'id_proof_file', 'p60_file']
\ No newline at end of file
+                            'payslip_file', 'contract_file', 'bank_statement_file', 'id_proof_file', 'p60_file',
+                            'extracted_data', 'main_document_type', 'pages_updated_at']
\ No newline at end of file
@@ -1,3 +1,845 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import utils
+from .cache import DiskCache
+from .classifier import TfidfCentroidClassifier, classify_text_locally, keyword_classify
+from .llm_backends import CannedBackend
+from .models import CustomerDocumentUpload, DocumentGroup, PageAnalysis, ProcessingJob
+from .processing import (
+    _analyse_in_windows,
+    analyse_document_group,
+    claim_next_job,
+    enqueue_document_upload,
+    process_document_upload,
+    requeue_stale_jobs,
+    run_job,
+)
+from .ratelimit import TokenBucketLimiter
+from .utils import (
+    analyse_page,
+    LLMDeadlineExceeded,
+    PipelineStage,
+    build_classification_batches,
+    classify_text_with_llm,
+    compact_group_texts,
+    compute_quality_metrics,
+    conform_to_schema,
+    is_usable_text_layer,
+    iter_split_pdf_pages,
+    llm_generate,
+    merge_page_analyses,
+    parse_monthly_amounts,
+    reduce_window_analyses,
+    render_page,
+    run_pipeline,
+    text_layer_quality,
+)
+from .views import REPORT_SECTIONS, anomaly_report
+
+
+def _upload(username="applicant", name="uploads/originals/upload.pdf"):
+    user, _ = get_user_model().objects.get_or_create(username=username)
+    return CustomerDocumentUpload.objects.create(user=user, original_file=name)
+
+
+class JobQueueTests(TestCase):
+    def test_oldest_pending_job_is_claimed_first(self):
+        first = enqueue_document_upload(_upload())
+        second = enqueue_document_upload(_upload())
+
+        job = claim_next_job()
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual(job.status, ProcessingJob.STATUS_RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.started_at)
+
+        self.assertEqual(claim_next_job().pk, second.pk)
+        self.assertIsNone(claim_next_job())
+
+    def test_only_stale_running_jobs_are_requeued(self):
+        stale = enqueue_document_upload(_upload())
+        fresh = enqueue_document_upload(_upload())
+        claim_next_job()
+        claim_next_job()
+        ProcessingJob.objects.filter(pk=stale.pk).update(started_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale_jobs(600), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, ProcessingJob.STATUS_PENDING)
+        self.assertEqual(fresh.status, ProcessingJob.STATUS_RUNNING)
+
+        job = claim_next_job()
+        self.assertEqual((job.pk, job.attempts), (stale.pk, 2))
+
+    def test_stale_job_out_of_attempts_is_failed(self):
+        job = enqueue_document_upload(_upload())
+        for attempt in range(1, 4):
+            claimed = claim_next_job()
+            self.assertEqual((claimed.pk, claimed.attempts), (job.pk, attempt))
+            ProcessingJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+            with redirect_stdout(io.StringIO()):
+                requeued = requeue_stale_jobs(600, max_attempts=3)
+            self.assertEqual(requeued, 1 if attempt < 3 else 0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProcessingJob.STATUS_FAILED)
+        self.assertIn("3 attempt(s)", job.error)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(claim_next_job())
+
+    def test_run_job_records_the_outcome(self):
+        enqueue_document_upload(_upload())
+        with mock.patch("documents.processing.process_document_upload"):
+            job = run_job(claim_next_job())
+        self.assertEqual(job.status, ProcessingJob.STATUS_DONE)
+        self.assertIsNotNone(job.finished_at)
+
+        enqueue_document_upload(_upload())
+        with mock.patch("documents.processing.process_document_upload", side_effect=RuntimeError("OCR crashed")), \
+                mock.patch("traceback.print_exc"):
+            job = run_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProcessingJob.STATUS_FAILED)
+        self.assertEqual(job.error, "OCR crashed")
+
+
+class RunPipelineTests(SimpleTestCase):
+    def test_results_keep_input_order(self):
+        def slow_double(n):
+            time.sleep(0.01 * (5 - n % 5))
+            return n * 2
+
+        stages = [PipelineStage("double", slow_double, workers=4), PipelineStage("inc", lambda n: n + 1)]
+        self.assertEqual(run_pipeline(iter(range(20)), stages, queue_size=2), [n * 2 + 1 for n in range(20)])
+
+    def test_batched_stage_receives_lists(self):
+        batches = []
+
+        def record(batch):
+            batches.append(list(batch))
+            return [n * 10 for n in batch]
+
+        stages = [PipelineStage("batch", record, batch_size=4, batch_wait=0.05)]
+        self.assertEqual(run_pipeline(range(10), stages, queue_size=10), [n * 10 for n in range(10)])
+        self.assertTrue(all(1 <= len(batch) <= 4 for batch in batches))
+
+    def test_first_error_is_raised(self):
+        def fail_on_three(n):
+            if n == 3:
+                raise ValueError("bad page")
+            return n
+
+        with self.assertRaisesMessage(ValueError, "bad page"):
+            run_pipeline(range(6), [PipelineStage("check", fail_on_three, workers=2)], queue_size=2)
+
+
+@override_settings(TEXT_LAYER_MIN_CHARS=40, TEXT_LAYER_MIN_QUALITY=0.7)
+class TextLayerTests(SimpleTestCase):
+    def test_born_digital_text_is_usable(self):
+        text = "Payslip for May 2024\nEmployee: Jo Bloggs  NI: AB123456C\nNet pay £1,234.56 (after tax)"
+        self.assertEqual(text_layer_quality(text), 1.0)
+        self.assertTrue(is_usable_text_layer(text))
+
+    def test_glyph_soup_is_rejected(self):
+        text = "(cid:12)(cid:7) (cid:3) \ufffd\ufffd ~~~ ^^ Net pay (cid:44)" * 3
+        self.assertLess(text_layer_quality(text), 0.7)
+        self.assertFalse(is_usable_text_layer(text))
+
+    def test_short_or_empty_layers_are_rejected(self):
+        self.assertEqual(text_layer_quality("   "), 0.0)
+        self.assertFalse(is_usable_text_layer("Page 1 of 2"))
+        self.assertTrue(is_usable_text_layer("Page 1 of 2", min_chars=5))
+
+    @override_settings(QUALITY_MAX_DIMENSION=1200)
+    def test_only_ocr_renders_at_300_dpi(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "page.pdf")
+            with fitz.open() as pdf:
+                pdf.new_page(width=595, height=842).insert_textbox(fitz.Rect(40, 40, 560, 800), "\n".join(
+                    f"{n:02d} May  Card payment TESCO STORES 2041  -12.50  Balance 1,234.56" for n in range(45)
+                ), fontsize=9)
+                pdf.save(path)
+
+            quality = {}
+            for mode, dpi, method in [("auto", 206, "text_layer"), ("ocr", 300, "ocr")]:
+                with self.subTest(mode=mode), mock.patch.object(utils, "render_page", wraps=render_page) as render, \
+                        mock.patch.object(utils, "easyocr_text_from_image", return_value="ocr text"):
+                    result = analyse_page(path, mode=mode)
+                self.assertEqual(render.call_args.kwargs["dpi"], dpi)
+                self.assertEqual(result["extraction_method"], method)
+                quality[mode] = result["quality"]
+
+        # Same decisions; the variance itself moves about as much between two 300+ dpi renders
+        for metric in ("blurry", "blank"):
+            self.assertEqual(quality["auto"][metric], quality["ocr"][metric])
+        self.assertAlmostEqual(quality["auto"]["blur_score"], quality["ocr"]["blur_score"],
+                               delta=0.2 * quality["ocr"]["blur_score"])
+
+
+class SplitPdfPagesTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.folder = tmp.name
+        self.path = os.path.join(tmp.name, "upload.pdf")
+        with fitz.open() as pdf:
+            for text in PAYSLIP_PAGES * 2:
+                pdf.new_page().insert_text((72, 72), text)
+            pdf.save(self.path)
+
+    def split(self, pages_wanted):
+        opened = []
+
+        def fitz_open(*args):
+            opened.append(real_open(*args))
+            return opened[-1]
+
+        real_open = fitz.open
+        with mock.patch("fitz.open", side_effect=fitz_open):
+            pages = iter_split_pdf_pages(self.path, self.folder)
+            paths = [next(pages) for _ in range(pages_wanted)]
+            pages.close()
+        return paths, opened
+
+    def test_every_document_is_closed(self):
+        for pages_wanted in (4, 1):  # drained, and abandoned after the first page
+            with self.subTest(pages_wanted=pages_wanted):
+                paths, docs = self.split(pages_wanted)
+                self.assertEqual(paths, [os.path.join(self.folder, f"page_{n}.pdf") for n in range(1, pages_wanted + 1)])
+                self.assertEqual(len(docs), pages_wanted + 1)
+                self.assertTrue(all(doc.is_closed for doc in docs))
+                with fitz.open(paths[-1]) as page:
+                    self.assertEqual(page.page_count, 1)
+
+
+class DiskCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_set_and_counters(self):
+        cache = DiskCache(self.path, max_bytes=1024)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", "value")
+        self.assertEqual(cache.get("a"), "value")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = DiskCache(self.path, max_bytes=25)
+        cache.set("old", "x" * 10)
+        time.sleep(0.01)
+        cache.set("new", "y" * 10)
+        time.sleep(0.01)
+        cache.get("old")
+        time.sleep(0.01)
+        cache.set("newest", "z" * 10)
+        self.assertEqual(cache.get("old"), "x" * 10)
+        self.assertIsNone(cache.get("new"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expired_entries_are_misses(self):
+        cache = DiskCache(self.path, max_bytes=1024, ttl=0.05)
+        cache.set("a", "value")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+
+
+def _analysis(fields, scores=None, missing=None, document_type="Payslip"):
+    return {
+        "document_type": document_type,
+        "extracted_fields": fields,
+        "confidence_scores": scores or {},
+        "missing_fields": missing or [],
+    }
+
+
+class MergePageAnalysesTests(SimpleTestCase):
+    def test_most_confident_value_wins(self):
+        merged, conflicts = merge_page_analyses([
+            _analysis({"Employee name": "J Doe"}, {"Employee name": 0.4}),
+            _analysis({"Employee name": "John Doe"}, {"Employee name": 0.9}),
+        ])
+        self.assertEqual(merged["extracted_fields"], {"Employee name": "John Doe"})
+        self.assertEqual(merged["confidence_scores"], {"Employee name": 0.9})
+        self.assertEqual(conflicts, ["Employee name"])
+
+    def test_earliest_page_breaks_ties_and_empty_values_are_ignored(self):
+        merged, conflicts = merge_page_analyses([
+            _analysis({"Address": "1 High St", "Employer name": "null"}),
+            _analysis({"Address": "2 Low Rd", "Employer name": "ACME Ltd"}),
+        ])
+        self.assertEqual(merged["extracted_fields"], {"Address": "1 High St", "Employer name": "ACME Ltd"})
+        self.assertEqual(conflicts, ["Address"])
+
+    def test_field_names_match_case_insensitively(self):
+        merged, conflicts = merge_page_analyses([
+            _analysis({"Net Pay": "1000"}, {"Net Pay": 0.5}),
+            _analysis({"net pay ": "1200"}, {"NET PAY": 0.8}),
+        ])
+        self.assertEqual(merged["extracted_fields"], {"Net Pay": "1200"})
+        self.assertEqual(merged["confidence_scores"], {"Net Pay": 0.8})
+        self.assertEqual(conflicts, ["Net Pay"])
+
+    def test_same_value_is_not_a_conflict(self):
+        merged, conflicts = merge_page_analyses([
+            _analysis({"Employer name": "ACME  Ltd"}),
+            _analysis({"employer name": "acme ltd"}),
+        ])
+        self.assertEqual(conflicts, [])
+
+    def test_missing_fields_only_lists_fields_no_page_supplied(self):
+        merged, conflicts = merge_page_analyses([
+            _analysis({"Gross monthly income": "2000"}, missing=["Tax/NI deductions", "Net monthly income"]),
+            _analysis({"net monthly income": "1600"}, missing=["gross monthly income"]),
+        ])
+        self.assertEqual(merged["missing_fields"], ["Tax/NI deductions"])
+
+
+class LocalClassifierTests(SimpleTestCase):
+    TRAINING = [
+        ("Payslip net pay gross pay income tax employee", "Payslip"),
+        ("payslip salary net pay tax code employee", "Payslip"),
+        ("bank statement sort code account number balance", "Bank Statement"),
+        ("statement sort code opening balance closing balance account", "Bank Statement"),
+    ]
+
+    def test_keyword_hits_and_margin_set_the_confidence(self):
+        self.assertEqual(keyword_classify("PAYSLIP  Net pay 1,000  Gross pay 1,200"), ("Payslip", 1.0))
+        self.assertEqual(keyword_classify("Payslip paid into account number 123"), ("Payslip", 0.0))
+        self.assertEqual(keyword_classify("Dear Sir or Madam"), ("Unknown", 0.0))
+
+    def test_centroid_model_round_trips_through_json(self):
+        texts, labels = zip(*self.TRAINING)
+        model = TfidfCentroidClassifier.train(list(texts), list(labels), min_df=1)
+        self.assertEqual(model.predict("your net pay and income tax this month")[0], "Payslip")
+        self.assertEqual(model.predict("closing balance on your account")[0], "Bank Statement")
+        self.assertEqual(model.predict("zzz qqq"), ("Unknown", 0.0))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.json")
+            model.save(path)
+            loaded = TfidfCentroidClassifier.load(path)
+        self.assertEqual(loaded.predict("sort code"), model.predict("sort code"))
+
+    def test_keyword_shortcut_keeps_its_labels(self):
+        self.assertEqual(classify_text_with_llm("Payslip  Net pay 1,000"), "payslip")
+        self.assertEqual(classify_text_with_llm("Sort code 12-34-56  Account number 123"), "bank_statement")
+        self.assertEqual(classify_text_with_llm("Passport"), "id proof")
+        self.assertEqual(classify_text_with_llm("Job title: analyst  Notice period: 1 month"), "contract")
+        self.assertEqual(classify_text_with_llm("P60 End of Year Certificate"), "p60")
+
+    def test_keywords_alone_are_used_until_a_model_is_trained(self):
+        with override_settings(LOCAL_CLASSIFIER_PATH="/nonexistent/document_classifier.json"):
+            self.assertEqual(classify_text_locally("P60 end of year certificate HMRC"), ("P60", 1.0))
+
+
+class ClassificationBatchTests(SimpleTestCase):
+    def test_batches_are_capped_by_page_count(self):
+        texts = ["short page"] * 5
+        self.assertEqual(build_classification_batches(texts, batch_size=2, max_tokens=1000, head_chars=100),
+                         [[0, 1], [2, 3], [4]])
+
+    def test_batches_are_capped_by_head_sample_tokens(self):
+        # Only the 400-char head counts: 101 tokens per page, so two pages fit in 250
+        texts = ["x" * 5000, "y" * 400, "z" * 400]
+        self.assertEqual(build_classification_batches(texts, batch_size=10, max_tokens=250, head_chars=400),
+                         [[0, 1], [2]])
+
+    def test_a_page_over_budget_still_gets_a_batch(self):
+        self.assertEqual(build_classification_batches(["x" * 4000], batch_size=10, max_tokens=10, head_chars=4000),
+                         [[0]])
+
+
+class TokenBucketLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "limits.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_requests_within_budget_do_not_wait(self):
+        limiter = TokenBucketLimiter(self.path, requests_per_minute=600, tokens_per_minute=0)
+        self.assertEqual(sum(limiter.acquire() for _ in range(5)), 0.0)
+
+    def test_exhausted_bucket_raises_past_max_wait(self):
+        limiter = TokenBucketLimiter(self.path, requests_per_minute=1, tokens_per_minute=0)
+        limiter.acquire()
+        with self.assertRaises(TimeoutError):
+            limiter.acquire(max_wait=0.1)
+
+    def test_tokens_are_limited_and_shared_through_the_file(self):
+        first = TokenBucketLimiter(self.path, requests_per_minute=0, tokens_per_minute=6000)
+        second = TokenBucketLimiter(self.path, requests_per_minute=0, tokens_per_minute=6000)
+        first.acquire(tokens=6000)
+        # Refills at 100 tokens/s: 50 more tokens take about half a second
+        waited = second.acquire(tokens=50, max_wait=5)
+        self.assertGreater(waited, 0.2)
+        self.assertGreater(second.stats()["waited_seconds"], 0)
+
+    def test_zero_limits_disable_the_buckets(self):
+        limiter = TokenBucketLimiter(self.path, requests_per_minute=0, tokens_per_minute=0)
+        self.assertEqual(limiter.acquire(tokens=10 ** 9, max_wait=0), 0.0)
+
+
+@override_settings(LLM_MAX_RETRIES=3, LLM_CALL_TIMEOUT=30)
+class DeadlineTests(SimpleTestCase):
+    def generate(self, deadline, outcomes):
+        calls = []
+
+        def fake_generate_once(*args):
+            calls.append(args[-1])
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        with mock.patch("documents.utils._generate_once", side_effect=fake_generate_once), \
+                mock.patch("documents.utils.backoff_delay", return_value=0.5), \
+                mock.patch("documents.utils.time.sleep"):
+            return llm_generate("analysis", "model", "prompt", {}, deadline=deadline), calls
+
+    def test_spent_budget_fails_without_calling_the_model(self):
+        with self.assertRaises(LLMDeadlineExceeded):
+            self.generate(time.monotonic() - 1, ["unused"])
+
+    def test_retryable_errors_are_retried_within_the_budget(self):
+        response, timeouts = self.generate(time.monotonic() + 10, [ConnectionError("reset"), "ok"])
+        self.assertEqual(response, "ok")
+        self.assertEqual(len(timeouts), 2)
+        # Each attempt is capped by the time left rather than LLM_CALL_TIMEOUT
+        self.assertTrue(all(timeout <= 10 for timeout in timeouts))
+
+    def test_no_retry_sleeps_past_the_deadline(self):
+        with self.assertRaises(LLMDeadlineExceeded):
+            self.generate(time.monotonic() + 0.2, [ConnectionError("reset"), "ok"])
+
+    def test_other_errors_are_not_retried(self):
+        with self.assertRaisesMessage(ValueError, "bad prompt"):
+            self.generate(None, [ValueError("bad prompt"), "ok"])
+
+
+class ConformToSchemaTests(SimpleTestCase):
+    def test_schema_names_are_normalised_and_missing_recomputed(self):
+        result = conform_to_schema("Payslip", _analysis(
+            {"employee NAME": "Jo Bloggs", "Pay date": "1 May 2024", "Net monthly income": "N/A"},
+            {"EMPLOYEE name": 0.8},
+        ))
+        self.assertEqual(result["extracted_fields"], {"Employee name": "Jo Bloggs", "Pay Date": "1 May 2024"})
+        self.assertEqual(result["confidence_scores"], {"Employee name": 0.8})
+        self.assertIn("Net monthly income", result["missing_fields"])
+        self.assertNotIn("Pay Date", result["missing_fields"])
+
+    def test_fields_outside_the_schema_are_kept(self):
+        result = conform_to_schema("Bank Statement", _analysis(
+            {"Transactions": "Bet365 £200", "Branch": "Leeds", "Notes": ""},
+        ))
+        self.assertEqual(result["extracted_fields"], {"Transactions": "Bet365 £200", "Branch": "Leeds"})
+
+
+@override_settings(PROMPT_REPEAT_EDGE_LINES=2, PROMPT_PAGE_TOKEN_BUDGET=0)
+class CompactGroupTextsTests(SimpleTestCase):
+    def test_running_header_and_footer_kept_once(self):
+        pages = [
+            f"ACME BANK plc\nStatement of account\nline {n} a\nline {n} b\nline {n} c\nPage footer text"
+            for n in range(3)
+        ]
+        compacted = compact_group_texts(pages)
+        self.assertIn("ACME BANK plc", compacted[0])
+        self.assertIn("Page footer text", compacted[0])
+        for text in compacted[1:]:
+            self.assertNotIn("ACME BANK plc", text)
+            self.assertNotIn("Page footer text", text)
+            self.assertIn("line", text)
+
+    def test_amounts_and_one_off_edge_lines_are_kept(self):
+        pages = [
+            "Header\nTesco\n12.50\nrent\nmore\nend",
+            "Header\n12.50\nTesco\nfoo\nmore\nend 2",
+            "Header\nbar\nbaz\nqux\nmore\nend 3",
+        ]
+        compacted = compact_group_texts(pages)
+        self.assertEqual(compacted[1].splitlines()[:2], ["12.50", "Tesco"])
+        self.assertNotIn("Header", compacted[1])
+        self.assertNotIn("Header", compacted[2])
+
+    def test_line_on_a_minority_of_pages_is_kept(self):
+        pages = ["Shared\na\nb\nc", "Shared\nd\ne\nf", "Other\ng\nh\ni", "Else\nj\nk\nl"]
+        compacted = compact_group_texts(pages)
+        self.assertTrue(compacted[1].startswith("Shared"))
+
+    def test_whitespace_and_rulings_are_removed(self):
+        [text] = compact_group_texts(["  Net   pay\t 100 \n-----\n\n| |\nTotal"])
+        self.assertEqual(text, "Net pay 100\nTotal")
+
+
+class MonthlyAmountsTests(SimpleTestCase):
+    def test_parses_strings_dicts_and_lists(self):
+        self.assertEqual(parse_monthly_amounts("Jan:45, Feb: £1,055.50"), {"Jan": 45.0, "Feb": 1055.5})
+        self.assertEqual(parse_monthly_amounts({"March": "12.5"}), {"Mar": 12.5})
+        self.assertEqual(parse_monthly_amounts(["Apr 2024: 10", "May 2024: 20"]), {"Apr 2024": 10.0, "May 2024": 20.0})
+
+    def test_ignores_non_months_and_empty_values(self):
+        self.assertEqual(parse_monthly_amounts("Total: 100, Jun: 5"), {"Jun": 5.0})
+        self.assertEqual(parse_monthly_amounts(None), {})
+
+
+class ReduceWindowAnalysesTests(SimpleTestCase):
+    def test_monthly_fields_are_summed_across_windows(self):
+        merged, conflicts = reduce_window_analyses([
+            _analysis({"Monthly expenses": "Jan:10, Feb:20", "Sort code": "12-34-56"}, document_type="Bank Statement"),
+            _analysis({"monthly expenses": "Feb:5, Mar:7", "Sort code": "12-34-56"}, document_type="Bank Statement"),
+        ])
+        self.assertEqual(merged["extracted_fields"]["Monthly expenses"], "Jan:10.00, Feb:25.00, Mar:7.00")
+        self.assertNotIn("monthly expenses", merged["extracted_fields"])
+        self.assertEqual(conflicts, [])
+
+    def test_other_fields_merge_as_per_page(self):
+        merged, conflicts = reduce_window_analyses([
+            _analysis({"Account number": "111"}, {"Account number": 0.3}),
+            _analysis({"Account number": "222"}, {"Account number": 0.7}),
+        ])
+        self.assertEqual(merged["extracted_fields"]["Account number"], "222")
+        self.assertEqual(conflicts, ["Account number"])
+
+
+class AnalyseInWindowsTests(SimpleTestCase):
+    PAGES = [{"page_number": n, "ocr_text": f"statement page {n}"} for n in range(1, 6)]
+
+    def analyse(self, answers):
+        def fake_analysis(text, deadline=None, document_type=None):
+            return answers[int(text.split()[2])]  # keyed by the window's first page
+
+        with mock.patch("documents.processing.llm_full_page_analysis", side_effect=fake_analysis), \
+                redirect_stdout(io.StringIO()):
+            return _analyse_in_windows("Bank Statement", self.PAGES, 2, deadline=None)
+
+    def test_complete_windows_are_not_flagged(self):
+        window = _analysis({"Monthly deposits": "Jan:100", "Sort code": "12-34-56"}, document_type="Bank Statement")
+        result = self.analyse({1: window, 3: window, 5: window})
+        self.assertEqual(result["extracted_fields"]["Monthly deposits"], "Jan:300.00")
+        self.assertNotIn("failed_windows", result)
+        self.assertEqual(result["missing_fields"], [])
+
+    def test_failed_window_marks_the_result_partial(self):
+        window = _analysis({"Monthly deposits": "Jan:100", "Sort code": "12-34-56"}, document_type="Bank Statement")
+        result = self.analyse({1: window, 3: {}, 5: window})
+        self.assertEqual(result["failed_windows"], [[3, 4]])
+        self.assertEqual(result["extracted_fields"]["Monthly deposits"], "Jan:200.00")
+        # The total is short of pages 3-4, and nobody supplied the other schema fields
+        self.assertIn("Monthly deposits", result["missing_fields"])
+        self.assertIn("Account number", result["missing_fields"])
+        self.assertNotIn("Sort code", result["missing_fields"])
+
+    @override_settings(PROMPT_COMPACTION_ENABLED=True, PROMPT_REPEAT_EDGE_LINES=2, PROMPT_PAGE_TOKEN_BUDGET=0)
+    def test_every_window_keeps_the_running_header(self):
+        pages = [{"page_number": n, "ocr_text": f"ACME BANK plc\nJo Bloggs 12-34-56\nline {n}\nmore {n}\nend {n}"}
+                 for n in range(1, 6)]
+        prompts = []
+
+        def fake_analysis(text, deadline=None, document_type=None):
+            prompts.append(text)
+            return {}
+
+        with mock.patch("documents.processing.llm_full_page_analysis", side_effect=fake_analysis), \
+                redirect_stdout(io.StringIO()):
+            _analyse_in_windows("Bank Statement", pages, 2, deadline=None)
+
+        self.assertEqual(len(prompts), 3)
+        for text in prompts:
+            self.assertEqual(text.count("ACME BANK plc"), 1)
+            self.assertEqual(text.count("Jo Bloggs 12-34-56"), 1)
+
+    def test_every_window_failing_lists_every_field_as_missing(self):
+        result = self.analyse({1: {}, 3: {}, 5: {}})
+        self.assertEqual(result["failed_windows"], [[1, 2], [3, 4], [5, 5]])
+        self.assertEqual(result["extracted_fields"], {})
+        self.assertIn("Monthly expenses", result["missing_fields"])
+
+
+class AnalyseDocumentGroupTests(SimpleTestCase):
+    PAYSLIP = {"Employer name": "ACME Ltd", "Employee name": "Jo Bloggs", "Gross monthly income": "2000",
+               "Net monthly income": "1600", "Tax/NI deductions": "250", "Address": "1 High St",
+               "National Insurance Number": "QQ123456C", "Pay Date": "28 May 2024"}
+
+    def analyse(self, document_type, analyses):
+        pages = [{"page_number": n, "analysis": analysis, "group_text": ""} for n, analysis in enumerate(analyses, 1)]
+        with mock.patch("documents.processing.llm_full_page_analysis") as group_call, redirect_stdout(io.StringIO()):
+            result = analyse_document_group(document_type, pages)
+        self.assertFalse(group_call.called)
+        return result
+
+    def test_reused_page_analysis_is_conformed(self):
+        fields = {name.lower(): value for name, value in self.PAYSLIP.items()}
+        result = self.analyse("Payslip", [_analysis(fields, {"net monthly income": 0.9}, ["Net pay"], "payslip")])
+        self.assertEqual(result["extracted_fields"], self.PAYSLIP)
+        self.assertEqual(result["confidence_scores"], {"Net monthly income": 0.9})
+        self.assertEqual((result["document_type"], result["missing_fields"]), ("Payslip", []))
+
+    def test_merged_page_analyses_are_conformed(self):
+        first = {name: value for name, value in self.PAYSLIP.items() if name != "Pay Date"}
+        result = self.analyse("Payslip", [_analysis(first, missing=["Pay Date"]),
+                                          _analysis({"pay date": "28 May 2024", "Notes": ""})])
+        self.assertEqual(result["extracted_fields"], self.PAYSLIP)
+        self.assertEqual(result["missing_fields"], [])
+
+    def test_untyped_groups_are_left_as_merged(self):
+        result = self.analyse("Other", [_analysis({"Reference": "A1"})])
+        self.assertEqual(result["extracted_fields"], {"Reference": "A1"})
+
+
+PAYSLIP_PAGES = [
+    "ACME Ltd Payslip\nEmployee: Jo Bloggs\nGross pay 2,000.00\nNet pay 1,600.00\nIncome tax 250.00",
+    "ACME Ltd Payslip\nEmployee: Jo Bloggs\nGross pay 2,000.00\nNet pay 1,600.00\nPay date 28 May 2024",
+]
+
+
+@override_settings(
+    OCR_WORKERS=1, OCR_CACHE_ENABLED=False, LLM_CACHE_ENABLED=False, LLM_CLASSIFY_BATCH_WAIT=0,
+    LLM_REQUESTS_PER_MINUTE=0, LLM_TOKENS_PER_MINUTE=0, LOCAL_CLASSIFIER_PATH="/nonexistent/model.json",
+    REPORT_CACHE_ENABLED=False,
+)
+class UploadTestCase(TestCase):
+    """A two-page payslip upload in a temporary MEDIA_ROOT, processed with the canned LLM backend."""
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name))
+        self.enterContext(mock.patch.object(utils, "_llm_backend", CannedBackend()))
+
+        name = "uploads/originals/payslips.pdf"
+        os.makedirs(os.path.join(self.media.name, os.path.dirname(name)))
+        with fitz.open() as pdf:
+            for text in PAYSLIP_PAGES:
+                pdf.new_page().insert_text((72, 72), text)
+            pdf.save(os.path.join(self.media.name, name))
+        self.upload = _upload(name=name)
+
+    def process(self):
+        with redirect_stdout(io.StringIO()):
+            process_document_upload(self.upload)
+
+
+class ProcessUploadTests(UploadTestCase):
+    def test_pages_are_written_and_the_upload_marked_processed(self):
+        self.process()
+        self.upload.refresh_from_db()
+        self.assertTrue(self.upload.processed)
+        self.assertEqual(list(self.upload.pages.values_list("page_number", flat=True).order_by("page_number")), [1, 2])
+        group = self.upload.groups.get()
+        self.assertEqual((group.document_type, group.first_page, group.last_page, group.page_count),
+                         ("Payslip", 1, 2, 2))
+        self.assertEqual(group.pages.count(), 2)
+        self.assertEqual(self.upload.main_document_type, "Payslip")
+        self.assertEqual(self.upload.extracted_data, {"Payslip": group.extracted_fields})
+
+    @override_settings(DOCUMENT_TIME_BUDGET=0)
+    def test_spent_time_budget_fails_the_job(self):
+        enqueue_document_upload(self.upload)
+        with redirect_stdout(io.StringIO()), mock.patch("traceback.print_exc"):
+            job = run_job(claim_next_job())
+
+        self.assertEqual(job.status, ProcessingJob.STATUS_FAILED)
+        self.assertIn("time budget", job.error)
+        self.upload.refresh_from_db()
+        self.assertFalse(self.upload.processed)
+        self.assertFalse(self.upload.pages.exists())
+
+    def test_failed_write_keeps_the_previous_result(self):
+        self.process()
+        previous = set(self.upload.pages.values_list("pk", flat=True))
+
+        with mock.patch.object(PageAnalysis.objects, "bulk_create", side_effect=RuntimeError("disk full")):
+            with self.assertRaisesMessage(RuntimeError, "disk full"):
+                self.process()
+
+        self.upload.refresh_from_db()
+        self.assertTrue(self.upload.processed)
+        self.assertEqual(set(self.upload.pages.values_list("pk", flat=True)), previous)
+        self.assertEqual(DocumentGroup.objects.filter(document=self.upload).count(), 1)
+
+
+class PagesToGroupsMigrationTests(TransactionTestCase):
+    migrate_from = [("documents", "0009_documentgroup")]
+    migrate_to = [("documents", "0010_pageanalysis_groups_data")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        apps = self.migrate(self.migrate_from)
+        self.addCleanup(lambda: self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes()))
+
+        user = apps.get_model("auth", "User").objects.create(username="applicant")
+        upload = apps.get_model("documents", "CustomerDocumentUpload").objects.create(user=user, original_file="a.pdf")
+        page_model = apps.get_model("documents", "PageAnalysis")
+        for page_number, document_type, fields in [(1, "Payslip", {}), (2, "Payslip", {"Net pay": "1600"}),
+                                                   (3, "P60", {"Total tax paid": "3000"})]:
+            page_model.objects.create(document=upload, page_number=page_number, page_path=f"page_{page_number}.pdf",
+                                      document_type=document_type, extracted_fields=fields,
+                                      confidence_scores={}, missing_fields=[])
+
+    def test_pages_are_grouped_by_document_type(self):
+        apps = self.migrate(self.migrate_to)
+        groups = apps.get_model("documents", "DocumentGroup").objects.order_by("first_page")
+        self.assertEqual(
+            [(g.document_type, g.first_page, g.last_page, g.page_count, g.extracted_fields) for g in groups],
+            [("Payslip", 1, 2, 2, {"Net pay": "1600"}), ("P60", 3, 3, 1, {"Total tax paid": "3000"})],
+        )
+        pages = apps.get_model("documents", "PageAnalysis").objects.order_by("page_number")
+        self.assertEqual([page.group.document_type for page in pages], ["Payslip", "Payslip", "P60"])
+
+    def test_reverse_copies_group_data_back_to_the_pages(self):
+        self.migrate(self.migrate_to)
+        apps = self.migrate(self.migrate_from)
+        self.assertFalse(apps.get_model("documents", "DocumentGroup").objects.exists())
+        pages = apps.get_model("documents", "PageAnalysis").objects.order_by("page_number")
+        self.assertEqual([(page.group_id, page.extracted_fields) for page in pages],
+                         [(None, {"Net pay": "1600"}), (None, {"Net pay": "1600"}), (None, {"Total tax paid": "3000"})])
+
+
+class ReportTestCase(UploadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.process()
+        self.client = APIClient()
+        self.client.force_authenticate(self.upload.user)
+        self.url = f"/api/v1/documents/{self.upload.id}/report/"
+
+    def get(self, url, **headers):
+        with redirect_stdout(io.StringIO()):
+            return self.client.get(url, **headers)
+
+
+class ReportEndpointTests(ReportTestCase):
+    def test_every_section_by_default(self):
+        response = self.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["document_id"], self.upload.id)
+        self.assertTrue(set(REPORT_SECTIONS) <= set(response.data))
+        self.assertEqual(response.data["quality"]["source"], "stored")
+        self.assertEqual([page["page"] for page in response.data["quality"]["quality_report"]], [1, 2])
+
+    def test_stored_and_recomputed_quality_have_the_same_fields(self):
+        stored = self.get(self.url + "?sections=quality").data["quality"]
+        recomputed = self.get(self.url + "?sections=quality&recompute=1").data["quality"]
+        self.assertEqual((stored["source"], recomputed["source"]), ("stored", "recomputed"))
+        self.assertEqual([set(page) for page in stored["quality_report"]],
+                         [set(page) for page in recomputed["quality_report"]])
+
+    def test_sections_can_be_selected(self):
+        response = self.get(self.url + "?sections=memo, quality")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data) - {"document_id", "file_name"}, {"memo", "quality"})
+
+    def test_unknown_section_is_a_bad_request(self):
+        response = self.get(self.url + "?sections=memo,credit_score")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("credit_score", response.data["error"])
+        self.assertEqual(response.data["available_sections"], list(REPORT_SECTIONS))
+
+
+
+class ConditionalReportTests(ReportTestCase):
+    def test_current_copy_gets_a_304(self):
+        response = self.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        response = self.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+
+        response = self.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_reprocessing_changes_the_etag(self):
+        etag = self.get(self.url)["ETag"]
+        self.process()
+        response = self.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_each_section_selection_has_its_own_etag(self):
+        self.assertNotEqual(self.get(self.url)["ETag"], self.get(self.url + "?sections=memo")["ETag"])
+
+    def test_uploads_without_pages_get_a_pending_quality_report(self):
+        url = f"/api/v1/documents/{_upload(name='uploads/originals/queued.pdf').id}/report/?sections=quality"
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["quality"]["source"], "pending")
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_recompute_is_never_answered_with_a_304(self):
+        etag = self.get(self.url + "?sections=quality")["ETag"]
+        response = self.get(self.url + "?sections=quality&recompute=1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["quality"]["source"], "recomputed")
+
+    def test_built_reports_are_cached_until_the_pages_change(self):
+        cache = DiskCache(os.path.join(self.media.name, "reports.sqlite3"), max_bytes=1024 * 1024)
+        with override_settings(REPORT_CACHE_ENABLED=True), mock.patch.object(utils, "_report_cache", cache), \
+                redirect_stdout(io.StringIO()):
+            first = anomaly_report(self.upload)
+            self.assertEqual(anomaly_report(self.upload), first)
+            self.assertEqual(cache.stats()["hits"], 1)
+
+            self.process()
+            self.upload.refresh_from_db()
+            anomaly_report(self.upload)
+            self.assertEqual(cache.stats()["misses"], 2)
+
+
+class QualityMetricsTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # A dense A4 text page at 300 dpi, like a payslip or statement scan
+        with fitz.open() as pdf:
+            page = pdf.new_page(width=595, height=842)
+            page.insert_textbox(fitz.Rect(40, 40, 560, 800), "\n".join(
+                f"{n:02d} May  Card payment TESCO STORES 2041  -12.50  Balance 1,234.56" for n in range(45)
+            ), fontsize=9)
+            pix, image = render_page(page)
+            cls.page = np.array(image)
+
+    def test_sharp_page_is_not_blurry(self):
+        metrics = compute_quality_metrics(self.page)
+        self.assertFalse(metrics["blurry"])
+        self.assertEqual(metrics["blurry_tile_ratio"], 0.0)
+
+    def test_blurred_page_is_flagged_on_the_downscaled_raster(self):
+        # Kernels the full-resolution check flagged (variance under 100 at 300 dpi)
+        for kernel in (9, 15, 21):
+            with self.subTest(kernel=kernel):
+                self.assertTrue(compute_quality_metrics(cv2.GaussianBlur(self.page, (kernel, kernel), 0))["blurry"])
+
+    def test_partly_blurred_page_is_caught_by_the_tiles(self):
+        image = self.page.copy()
+        image[:, : image.shape[1] // 2] = cv2.GaussianBlur(image[:, : image.shape[1] // 2], (15, 15), 0)
+        self.assertGreaterEqual(compute_quality_metrics(image)["blurry_tile_ratio"], 0.4)
@@ -1,17 +1,31 @@
-import fitz  # PyMuPDF
 import os
-import cv2
 import numpy as np
 # import pytesseract
 import re
 import requests
 import json
-import easyocr
+import math
+import multiprocessing
+import queue
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-import google.generativeai as genai
-from pdf2image import convert_from_path
 from django.conf import settings
 from rapidfuzz import fuzz
+from .cache import DiskCache, content_hash
+from .classifier import keyword_scores
+from .ratelimit import TokenBucketLimiter
+from .llm_backends import (
+    build_llm_backend,
+    LLMBackendError,
+    TASK_PAGE_ANALYSIS,
+    TASK_CLASSIFY_PAGES,
+    TASK_EXTRACT_FIELDS,
+)
 # from paddleocr import PaddleOCR
 from PIL import Image, ImageFile
 from datetime import datetime, timedelta
@@ -19,15 +33,6 @@ from datetime import datetime, timedelta
 # Allow loading truncated images
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
-# --- API Tokens ---
-HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/facebook/bart-large-mnli"
-HUGGINGFACE_API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
-headers = {"Authorization": f"Bearer {HUGGINGFACE_API_TOKEN}"}
-
-# Gemini API Config
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
-
 # --- OCR Engines ---
 #ocr_engine = PaddleOCR(
 #    use_angle_cls=True,
@@ -35,41 +40,590 @@ genai.configure(api_key=GEMINI_API_KEY)
 #    det_db_box_thresh=0.5,
 #    use_gpu=False
 #)
-easyocr_reader = easyocr.Reader(['en'])
 
-# --- Utility Functions ---
+# Heavy engines (PyMuPDF, OpenCV, torch via EasyOCR, the Gemini SDK) are imported and
+# built on first use, so migrate/check/shell and API-only web workers boot without them.
+_engine_lock = threading.Lock()
+_easyocr_reader = None
+_llm_backend = None
+
+def get_easyocr_reader():
+    global _easyocr_reader
+    if _easyocr_reader is None:
+        with _engine_lock:
+            if _easyocr_reader is None:
+                import easyocr
+                _easyocr_reader = easyocr.Reader(['en'])
+    return _easyocr_reader
+
+def get_llm_backend():
+    """
+    The LLM_BACKEND every prompt and zero-shot call goes through (see documents/llm_backends.py).
+    """
+    global _llm_backend
+    if _llm_backend is None:
+        with _engine_lock:
+            if _llm_backend is None:
+                _llm_backend = build_llm_backend(
+                    settings.LLM_BACKEND,
+                    url=settings.LLM_BACKEND_URL,
+                    record_path=settings.LLM_RECORD_PATH,
+                    replay_path=settings.LLM_REPLAY_PATH,
+                )
+    return _llm_backend
+
+_ocr_cache = None
+
+def get_ocr_cache():
+    """
+    The OCR result cache, or None when OCR_CACHE_ENABLED is off.
+    """
+    global _ocr_cache
+    if not settings.OCR_CACHE_ENABLED:
+        return None
+    if _ocr_cache is None:
+        _ocr_cache = DiskCache(settings.OCR_CACHE_PATH, settings.OCR_CACHE_MAX_BYTES)
+    return _ocr_cache
+
+_llm_cache = None
+
+def get_llm_cache():
+    """
+    The LLM response cache, or None when LLM_CACHE_ENABLED is off.
+    """
+    global _llm_cache
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        _llm_cache = DiskCache(settings.LLM_CACHE_PATH, settings.LLM_CACHE_MAX_BYTES, ttl=settings.LLM_CACHE_TTL)
+    return _llm_cache
+
+_report_cache = None
 
-def split_pdf_into_pages(original_pdf_path, output_folder):
-    doc = fitz.open(original_pdf_path)
-    page_paths = []
-    for page_number in range(doc.page_count):
-        page = doc.load_page(page_number)
-        single_page_doc = fitz.open()
-        single_page_doc.insert_pdf(doc, from_page=page_number, to_page=page_number)
-        output_path = os.path.join(output_folder, f"page_{page_number + 1}.pdf")
-        single_page_doc.save(output_path)
-        page_paths.append(output_path)
-    return page_paths
-
-def easyocr_text_from_pdf(pdf_path):
-    pages = convert_from_path(pdf_path, dpi=300, thread_count=1)
-    full_text = ""
-    for idx, page in enumerate(pages):
-        temp_path = f"temp_page_{idx}.jpg"
-        page.save(temp_path)
+def get_report_cache():
+    """
+    The computed report cache, or None when REPORT_CACHE_ENABLED is off.
+    """
+    global _report_cache
+    if not settings.REPORT_CACHE_ENABLED:
+        return None
+    if _report_cache is None:
+        _report_cache = DiskCache(settings.REPORT_CACHE_PATH, settings.REPORT_CACHE_MAX_BYTES)
+    return _report_cache
+
+_llm_limiter = None
+
+def get_llm_limiter():
+    """
+    The shared Gemini quota limiter, or None when both per-minute limits are 0.
+    """
+    global _llm_limiter
+    if not (settings.LLM_REQUESTS_PER_MINUTE or settings.LLM_TOKENS_PER_MINUTE):
+        return None
+    if _llm_limiter is None:
+        _llm_limiter = TokenBucketLimiter(
+            settings.LLM_RATE_LIMIT_PATH, settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE
+        )
+    return _llm_limiter
+
+def ocr_engine_signature():
+    """
+    Identifies the OCR engine and settings, so a cached result is only reused when
+    the same engine would have produced it.
+    """
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        engine_version = version("easyocr")
+    except PackageNotFoundError:
+        engine_version = "unknown"
+    return f"easyocr-{engine_version}|lang=en|detail=0"
 
+def warm_up_engines(ocr=True, llm=True):
+    """
+    Build the engines up front in processes that will really do OCR/LLM work, so the
+    first page doesn't pay for loading the models.
+    """
+    if ocr:
+        import fitz  # noqa: F401
+        import cv2  # noqa: F401
+        get_easyocr_reader()
+    if llm:
+        get_llm_backend().warm_up()
+
+# --- LLM Dispatch ---
+
+class LLMDeadlineExceeded(TimeoutError):
+    pass
+
+# HTTP statuses worth another attempt; anything else (bad request, auth) fails straight away
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+def is_retryable_error(error):
+    if isinstance(error, (TimeoutError, ConnectionError, requests.RequestException)):
+        return True
+    # google.api_core errors carry the HTTP status as `.code`
+    return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    base = settings.LLM_BACKOFF_BASE if base is None else base
+    cap = settings.LLM_BACKOFF_MAX if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def time_left(deadline):
+    """Seconds until a time.monotonic() deadline, or None when there is no deadline."""
+    return None if deadline is None else deadline - time.monotonic()
+
+class LatencyTracker:
+    """
+    Recent successful call latencies per model, to decide when a call is slow enough to hedge.
+    """
+    def __init__(self, size=200):
+        self._samples = {}
+        self._size = size
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self._size)).append(seconds)
+
+    def percentile(self, key, fraction, min_samples):
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+llm_latencies = LatencyTracker()
+_hedge_pool = None
+
+def get_hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _engine_lock:
+            if _hedge_pool is None:
+                # Room for a primary and a hedge from every pipeline and llm_map thread
+                _hedge_pool = ThreadPoolExecutor(max_workers=4 * settings.LLM_WORKERS, thread_name_prefix="llm-hedge")
+    return _hedge_pool
+
+def _acquire_llm_quota(prompt, timeout):
+    limiter = get_llm_limiter()
+    if limiter is not None:
+        waited = limiter.acquire(estimate_tokens(prompt), max_wait=timeout)
+        if waited:
+            print(f"⏳ Waited {waited:.1f}s for LLM quota")
+
+def _generate_once(task, model_name, prompt, generation_config, timeout):
+    """One attempt, hedged with a duplicate request once it outlasts the usual latency."""
+    def call():
+        _acquire_llm_quota(prompt, timeout)
+        started = time.monotonic()
+        text = get_llm_backend().generate(task, model_name, prompt, generation_config, timeout)
+        llm_latencies.record(model_name, time.monotonic() - started)
+        return text
+
+    hedge_after = None
+    if settings.LLM_HEDGE_PERCENTILE:
+        hedge_after = llm_latencies.percentile(model_name, settings.LLM_HEDGE_PERCENTILE, settings.LLM_HEDGE_MIN_SAMPLES)
+    if hedge_after is None or hedge_after >= timeout:
+        return call()
+
+    pool = get_hedge_pool()
+    started = time.monotonic()
+    futures = [pool.submit(call)]
+    done, _ = wait(futures, timeout=hedge_after)
+    if not done:
+        print(f"🔀 {model_name} call slower than {hedge_after:.1f}s, sending a hedged duplicate")
+        futures.append(pool.submit(call))
+
+    error = None
+    while futures:
+        remaining = timeout - (time.monotonic() - started)
+        done, _ = wait(futures, timeout=max(0.0, remaining), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            futures.remove(future)
+            if future.exception() is None:
+                # The loser finishes in the background; its timeout bounds it
+                return future.result()
+            error = future.exception()
+    raise error or TimeoutError(f"{model_name} call timed out after {timeout:.1f}s")
+
+def llm_generate(task, model_name, prompt, generation_config, deadline=None):
+    """
+    Response text for `prompt` from the LLM backend, behind the shared requests/tokens-per-minute
+    limiter, with a per-attempt timeout, jittered exponential backoff between retries and
+    optional hedging.
+
+    `deadline` is a time.monotonic() value (usually the document's time budget); no attempt
+    or backoff sleep runs past it, and LLMDeadlineExceeded is raised once it has passed.
+    Safe to call from many threads at once.
+    """
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        remaining = time_left(deadline)
+        if remaining is not None and remaining <= 0:
+            raise LLMDeadlineExceeded(f"{model_name} call abandoned: document time budget spent")
+
+        timeout = settings.LLM_CALL_TIMEOUT if remaining is None else min(settings.LLM_CALL_TIMEOUT, remaining)
         try:
-            img = Image.open(temp_path)
-            img.verify()
-            img = Image.open(temp_path)
-            results = easyocr_reader.readtext(temp_path, detail=0)
-            for line in results:
-                full_text += line + "\n"
+            return _generate_once(task, model_name, prompt, generation_config, timeout)
         except Exception as e:
-            print(f"Skipping unreadable page {temp_path}: {e}")
+            if attempt == settings.LLM_MAX_RETRIES or not is_retryable_error(e):
+                raise
+            delay = backoff_delay(attempt)
+            remaining = time_left(deadline)
+            if remaining is not None and delay >= remaining:
+                raise LLMDeadlineExceeded(f"{model_name} call abandoned: no time left to retry after {e!r}") from e
+            print(f"🔁 {model_name} attempt {attempt + 1} failed ({e!r}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def llm_map(func, items, workers=None):
+    """
+    Apply an LLM-bound `func` to every item on LLM_WORKERS threads; results keep input order.
+    Each call gets its own short-lived pool, so a mapped function may itself call llm_map.
+    """
+    items = list(items)
+    workers = min(workers or settings.LLM_WORKERS, len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm") as pool:
+        return list(pool.map(func, items))
+
+# --- Utility Functions ---
+
+def iter_split_pdf_pages(original_pdf_path, output_folder):
+    """
+    Write each page to its own PDF and yield the paths one at a time, so the
+    pipeline can start OCR on page 1 while later pages are still being split.
+    """
+    import fitz  # PyMuPDF
+    # Also closed if the caller abandons the generator (a failed pipeline stage)
+    with fitz.open(original_pdf_path) as doc:
+        for page_number in range(doc.page_count):
+            output_path = os.path.join(output_folder, f"page_{page_number + 1}.pdf")
+            with fitz.open() as single_page_doc:
+                single_page_doc.insert_pdf(doc, from_page=page_number, to_page=page_number)
+                single_page_doc.save(output_path)
+            yield output_path
+
+# ---------- Rasterization ----------
+
+def pixmap_to_array(pix):
+    """
+    Zero-copy HxWxN uint8 NumPy view over a pixmap's samples.
+    The view borrows the pixmap's memory, so keep `pix` referenced while using it.
+    """
+    return np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+def render_page(page, dpi=300):
+    """
+    Rasterize an open fitz page to RGB. Returns (pixmap, array view).
+    """
+    import fitz  # PyMuPDF
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+    return pix, pixmap_to_array(pix)
+
+def iter_rendered_pages(pdf_path, dpi=300):
+    """
+    Yield (pixmap, RGB array view) for every page, rendered in-process by MuPDF.
+    """
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            yield render_page(page, dpi=dpi)
+
+# ---------- Embedded Text Layer ----------
+_WORD_LIKE = re.compile(r"^[\w£$€%&@#()\[\]'\".,:;/+\-*]+$")
+
+def text_layer_quality(text):
+    """
+    Share of whitespace-separated tokens that look like real words/numbers rather than
+    glyph soup ("(cid:12)", replacement chars, runs of symbols from broken font maps).
+    """
+    tokens = text.split()
+    if not tokens:
+        return 0.0
+    clean = 0
+    for token in tokens:
+        if "\ufffd" in token or "(cid:" in token or len(token) > 40:
             continue
+        if _WORD_LIKE.match(token) and any(ch.isalnum() for ch in token):
+            clean += 1
+    return clean / len(tokens)
+
+def is_usable_text_layer(text, min_chars=None, min_quality=None):
+    min_chars = settings.TEXT_LAYER_MIN_CHARS if min_chars is None else min_chars
+    min_quality = settings.TEXT_LAYER_MIN_QUALITY if min_quality is None else min_quality
+    stripped = text.strip()
+    return len(stripped) >= min_chars and text_layer_quality(stripped) >= min_quality
+
+def _text_layer(page, mode):
+    """
+    The page's embedded text when `mode` lets it stand in for OCR, otherwise None.
+    """
+    if mode == "ocr":
+        return None
+    layer_text = page.get_text("text")
+    if mode == "text_layer" or is_usable_text_layer(layer_text):
+        return layer_text
+    return None
 
-    return full_text
+def _quality_dpi(page):
+    """
+    Lowest dpi whose raster gives the same quality metrics as a 300 dpi one: twice
+    QUALITY_MAX_DIMENSION on the long edge, which the INTER_AREA downscale turns into the
+    same pixels (about 206 dpi for A4). Never above 300.
+    """
+    max_dimension = settings.QUALITY_MAX_DIMENSION
+    if not max_dimension:
+        return 300
+    long_edge = max(page.rect.width, page.rect.height)
+    return min(300, math.ceil(2 * max_dimension * 72 / long_edge))
+
+def _page_text(page, mode, image=None):
+    """
+    (text, method) for one open fitz page. `image` lets a caller that already rendered
+    the page reuse that raster for OCR.
+    """
+    layer_text = _text_layer(page, mode)
+    if layer_text is not None:
+        return layer_text, "text_layer"
+
+    if image is None:
+        pix, image = render_page(page, dpi=300)
+    try:
+        return easyocr_text_from_image(image), "ocr"
+    except Exception as e:
+        print(f"Skipping unreadable page {page.number + 1}: {e}")
+        return "", "ocr"
+
+def analyse_page(page_path, mode=None):
+    """
+    Ingest one single-page PDF: render it once, score blur/blank on that raster and
+    extract its text (reusing the same raster if it needs OCR). Only OCR needs 300 dpi, so a
+    page read from its text layer is rendered at the lower _quality_dpi.
+    """
+    import fitz  # PyMuPDF
+    mode = mode or settings.TEXT_EXTRACTION_MODE
+    with fitz.open(page_path) as doc:
+        page = doc[0]
+        layer_text = _text_layer(page, mode)
+        pix, image = render_page(page, dpi=300 if layer_text is None else _quality_dpi(page))
+        quality = page_quality(image)
+        if layer_text is not None:
+            text, method = layer_text, "text_layer"
+        else:
+            text, method = _page_text(page, "ocr", image=image)
+
+    return {
+        "text": text,
+        "extraction_method": method,
+        "quality": quality,
+    }
+
+def easyocr_text_from_image(image):
+    """
+    OCR an image held in memory: a NumPy array (e.g. a pixmap view), a PIL image,
+    or encoded image bytes. Nothing touches the disk, so concurrent calls are safe.
+    """
+    # EasyOCR's detector wants RGB arrays; it decodes bytes itself
+    if isinstance(image, Image.Image):
+        image = np.asarray(image.convert("RGB"))
+    elif isinstance(image, (bytearray, memoryview)):
+        image = bytes(image)
+
+    # Re-uploaded pages render to identical pixels, so the raster is the cache key
+    cache = get_ocr_cache()
+    cache_key = None
+    if cache is not None:
+        if isinstance(image, np.ndarray):
+            cache_key = content_hash(ocr_engine_signature(), str(image.shape), np.ascontiguousarray(image).data)
+        elif isinstance(image, bytes):
+            cache_key = content_hash(ocr_engine_signature(), image)
+        if cache_key is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+    results = get_easyocr_reader().readtext(image, detail=0)
+    text = "".join(line + "\n" for line in results)
+
+    if cache_key is not None:
+        cache.set(cache_key, text)
+    return text
+
+# ---------- Parallel OCR ----------
+_ocr_pool = None
+_ocr_pool_workers = 0
+
+def _init_ocr_worker():
+    """
+    Runs once in every OCR process: pin torch/OpenCV to one thread so N workers don't
+    oversubscribe N cores, then load this process's own EasyOCR reader.
+    """
+    import cv2
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    warm_up_engines(ocr=True, llm=False)
+
+def get_ocr_pool(workers=None):
+    """
+    Return the shared OCR process pool, (re)creating it when the worker count changes.
+    """
+    global _ocr_pool, _ocr_pool_workers
+    workers = workers or settings.OCR_WORKERS
+    if _ocr_pool is None or _ocr_pool_workers != workers:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=True)
+        # spawn rather than fork: torch does not survive being forked with live threads
+        _ocr_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ocr_worker,
+        )
+        _ocr_pool_workers = workers
+    return _ocr_pool
+
+def shutdown_ocr_pool():
+    global _ocr_pool, _ocr_pool_workers
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(wait=True)
+    _ocr_pool = None
+    _ocr_pool_workers = 0
+
+def extract_page(page_path, workers=None):
+    """
+    Run analyse_page for one single-page PDF on the process pool (or inline when
+    OCR_WORKERS is 1). Meant to be called from several pipeline threads at once.
+    """
+    workers = workers or settings.OCR_WORKERS
+    if workers <= 1:
+        return analyse_page(page_path)
+
+    pool = get_ocr_pool(workers)
+    try:
+        return pool.submit(analyse_page, page_path).result()
+    except BrokenProcessPool:
+        shutdown_ocr_pool()
+        raise
+
+# ---------- Staged Pipeline ----------
+_PIPELINE_DONE = object()
+
+class PipelineStage:
+    """
+    One step of run_pipeline: `func` is applied to every item by `workers` threads.
+
+    With batch_size > 1, `func` instead receives a list of up to batch_size items and must
+    return a list of results in the same order. A worker takes whatever is already queued,
+    waiting at most batch_wait seconds for more, so batching never stalls the pipeline.
+    """
+    def __init__(self, name, func, workers=1, batch_size=1, batch_wait=0.0):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = batch_wait
+
+def run_pipeline(items, stages, queue_size=None):
+    """
+    Stream `items` through `stages` (e.g. render -> OCR -> LLM) connected by bounded queues.
+
+    Every stage runs concurrently with the others, so page N+1 is OCR'd while page N's
+    LLM call is in flight; a full queue blocks the stage upstream of it, which caps how
+    many rendered pages sit in memory. `items` may be a lazy generator - it is consumed
+    on its own feeder thread. Results are returned in input order. If a stage raises,
+    the remaining items are drained and the first error is re-raised.
+    """
+    queue_size = queue_size or settings.PIPELINE_QUEUE_SIZE
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    remaining_workers = [stage.workers for stage in stages]
+    lock = threading.Lock()
+    errors = []
+
+    def feed():
+        try:
+            for idx, item in enumerate(items):
+                if errors:
+                    break
+                queues[0].put((idx, item))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            for _ in range(stages[0].workers):
+                queues[0].put(_PIPELINE_DONE)
+
+    def next_batch(stage, inbox):
+        """Returns (entries, done): at least one entry unless upstream is finished."""
+        entry = inbox.get()
+        if entry is _PIPELINE_DONE:
+            return [], True
+        entries = [entry]
+        deadline = time.monotonic() + stage.batch_wait
+        while len(entries) < stage.batch_size:
+            try:
+                entry = inbox.get(timeout=max(0.0, deadline - time.monotonic())) if stage.batch_wait else inbox.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _PIPELINE_DONE:
+                return entries, True
+            entries.append(entry)
+        return entries, False
+
+    def work(stage_idx):
+        stage = stages[stage_idx]
+        inbox, outbox = queues[stage_idx], queues[stage_idx + 1]
+        done = False
+        while not done:
+            entries, done = next_batch(stage, inbox)
+            if not entries or errors:
+                continue
+            try:
+                if stage.batch_size > 1:
+                    outputs = stage.func([value for idx, value in entries])
+                else:
+                    outputs = [stage.func(entries[0][1])]
+                for (idx, value), output in zip(entries, outputs):
+                    outbox.put((idx, output))
+            except Exception as e:
+                print(f"Pipeline stage '{stage.name}' failed on item {entries[0][0]}: {e}")
+                errors.append(e)
+
+        # The last worker of a stage to finish tells every worker downstream to stop
+        with lock:
+            remaining_workers[stage_idx] -= 1
+            last_worker = remaining_workers[stage_idx] == 0
+        if last_worker:
+            downstream = stages[stage_idx + 1].workers if stage_idx + 1 < len(stages) else 1
+            for _ in range(downstream):
+                outbox.put(_PIPELINE_DONE)
+
+    threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+    for stage_idx, stage in enumerate(stages):
+        for n in range(stage.workers):
+            threads.append(threading.Thread(target=work, args=(stage_idx,), name=f"pipeline-{stage.name}-{n}", daemon=True))
+    for thread in threads:
+        thread.start()
+
+    results = {}
+    while True:
+        entry = queues[-1].get()
+        if entry is _PIPELINE_DONE:
+            break
+        idx, value = entry
+        results[idx] = value
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return [results[idx] for idx in sorted(results)]
 
 #def paddle_ocr_text_from_pdf(pdf_path):
 #    pages = convert_from_path(pdf_path, dpi=300)
@@ -84,6 +638,7 @@ def easyocr_text_from_pdf(pdf_path):
 #    return full_text
 
 def merge_pdfs(page_paths, output_path):
+    import fitz  # PyMuPDF
     merged_doc = fitz.open()
     for path in page_paths:
         single_doc = fitz.open(path)
@@ -91,66 +646,124 @@ def merge_pdfs(page_paths, output_path):
     merged_doc.save(output_path)
     return output_path
 
-def classify_text_with_llm(text, retries=3, wait_time=5):
-    text_lower = text.lower()
-    keyword_map = {
-        "payslip": ["payslip", "net pay", "gross pay", "salary", "income tax"],
-        "contract": ["employment contract", "job title", "employer", "position"],
-        "bank_statement": ["account number", "sort code", "bank statement", "transaction"],
-        "id proof": ["passport", "driving license", "identity card"],
-        "p60": ["p60", "tax year ending", "hmrc"],
-    }
-    scores = {}
-    for doc_type, keywords in keyword_map.items():
-        score = sum(1 for keyword in keywords if keyword in text_lower)
-        scores[doc_type] = score
+# Labels the keyword shortcut has always returned, per DOCUMENT_KEYWORDS type
+KEYWORD_SHORTCUT_LABELS = {
+    "Payslip": "payslip",
+    "Contract of Employment": "contract",
+    "Bank Statement": "bank_statement",
+    "ID Proof(Passport, Driving License)": "id proof",
+    "P60": "p60",
+}
 
+def classify_text_with_llm(text, retries=3, wait_time=5, deadline=None):
+    # Same keyword map as the local classifier
+    scores = keyword_scores(text)
     best_match = max(scores, key=scores.get)
     highest_score = scores[best_match]
 
-    if best_match == 'id proof' and highest_score >= 1:
-        return best_match
+    if best_match.startswith("ID Proof") and highest_score >= 1:
+        return KEYWORD_SHORTCUT_LABELS[best_match]
     if highest_score >= 2:
-        return best_match
+        return KEYWORD_SHORTCUT_LABELS[best_match]
 
-    payload = {
-        "inputs": text,
-        "parameters": {
-            "candidate_labels": ["Payslip", "Contract", "Bank Statement", "ID Proof", "P60 Form"]
-        }
-    }
+    candidate_labels = ["Payslip", "Contract", "Bank Statement", "ID Proof", "P60 Form"]
     for attempt in range(retries):
-        response = requests.post(HUGGINGFACE_API_URL, headers=headers, json=payload)
-        response_data = response.json()
-        if 'labels' in response_data:
-            return response_data['labels'][0].lower()
+        remaining = time_left(deadline)
+        if remaining is not None and remaining <= 0:
+            break
+        timeout = settings.LLM_CALL_TIMEOUT if remaining is None else min(settings.LLM_CALL_TIMEOUT, remaining)
+        try:
+            response_data = get_llm_backend().zero_shot(text, candidate_labels, timeout)
+            if 'labels' in response_data:
+                return response_data['labels'][0].lower()
+            # e.g. {"error": "Model is currently loading", "estimated_time": 20}
+            print(f"Zero-shot classification attempt {attempt + 1}: unexpected response {response_data}")
+        except (requests.RequestException, LLMBackendError, ValueError) as e:
+            print(f"Zero-shot classification attempt {attempt + 1} failed: {e}")
+
+        # wait_time is the backoff base; never sleep past the deadline
+        delay = backoff_delay(attempt, base=wait_time)
+        remaining = time_left(deadline)
+        if attempt == retries - 1 or (remaining is not None and delay >= remaining):
+            break
+        time.sleep(delay)
     return "unknown"
 
 def check_page_quality(pdf_path):
-    pages = convert_from_path(pdf_path, dpi=300)
     results = []
-    for idx, page in enumerate(pages):
-        open_cv_image = np.array(page.convert('RGB'))
-        image = open_cv_image[:, :, ::-1].copy()
-        blurry, blur_score = is_blurry(image)
-        blank, blank_score = is_blank(image)
-        page_result = {
-            "page": idx + 1,
-            "blurry": blurry,
-            "blur_score": blur_score,
-            "blank": blank,
-            "blank_score": blank_score,
-        }
+    for idx, (pix, image) in enumerate(iter_rendered_pages(pdf_path, dpi=300)):
+        page_result = {"page": idx + 1}
+        page_result.update(page_quality(image))
         results.append(page_result)
     return results
 
-def is_blurry(image, threshold=100):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+def page_quality(image, rgb=True):
+    """
+    Blur/blank metrics for one rendered page as plain JSON/DB-friendly values.
+    """
+    return compute_quality_metrics(image, rgb=rgb)
+
+def compute_quality_metrics(image, rgb=True, max_dimension=None, tile_grid=None,
+                            blur_threshold=None, blank_threshold=None):
+    """
+    Fused quality pass: one grayscale conversion, one INTER_AREA downscale and one
+    Laplacian, from which page blur variance, blank ratio and per-tile blur are all
+    derived. Replaces running is_blurry and is_blank (two full-size cvtColor calls).
+
+    Tiles that are almost entirely white are ignored for the tile stats, otherwise page
+    margins would always count as "blurry".
+    """
+    import cv2
+
+    max_dimension = settings.QUALITY_MAX_DIMENSION if max_dimension is None else max_dimension
+    tile_grid = settings.QUALITY_TILE_GRID if tile_grid is None else tile_grid
+    blur_threshold = settings.QUALITY_BLUR_THRESHOLD if blur_threshold is None else blur_threshold
+    blank_threshold = settings.QUALITY_BLANK_THRESHOLD if blank_threshold is None else blank_threshold
+
+    if image.ndim == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY if rgb else cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+
+    height, width = gray.shape
+    if max_dimension and max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        gray = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+    white = gray > 245
+
+    blur_score = float(laplacian.var(dtype=np.float64))
+    blank_score = float(np.count_nonzero(white)) / white.size
+
+    blurry_tile_ratio = 0.0
+    tile_h, tile_w = gray.shape[0] // max(tile_grid, 1), gray.shape[1] // max(tile_grid, 1)
+    if tile_grid > 1 and tile_h and tile_w:
+        crop_h, crop_w = tile_h * tile_grid, tile_w * tile_grid
+        tile_blur = laplacian[:crop_h, :crop_w].reshape(tile_grid, tile_h, tile_grid, tile_w).var(axis=(1, 3), dtype=np.float64)
+        tile_white = white[:crop_h, :crop_w].reshape(tile_grid, tile_h, tile_grid, tile_w).mean(axis=(1, 3))
+        content = tile_white <= blank_threshold
+        if content.any():
+            blurry_tile_ratio = float(np.count_nonzero(tile_blur[content] < blur_threshold)) / int(content.sum())
+
+    return {
+        "blurry": blur_score < blur_threshold,
+        "blur_score": blur_score,
+        "blank": blank_score > blank_threshold,
+        "blank_score": blank_score,
+        "blurry_tile_ratio": blurry_tile_ratio,
+    }
+
+def is_blurry(image, threshold=100, rgb=False):
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY if rgb else cv2.COLOR_BGR2GRAY)
     variance = cv2.Laplacian(gray, cv2.CV_64F).var()
     return variance < threshold, variance
 
-def is_blank(image, threshold=0.99):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+def is_blank(image, threshold=0.99, rgb=False):
+    import cv2
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY if rgb else cv2.COLOR_BGR2GRAY)
     white_pixels = np.sum(gray > 245)
     total_pixels = gray.shape[0] * gray.shape[1]
     blank_ratio = white_pixels / total_pixels
@@ -202,7 +815,7 @@ def check_ocr_completeness(text, document_type):
             missing_fields.append(field)
     return missing_fields
 
-def llm_extract_fields_with_gemini(document_text):
+def llm_extract_fields_with_gemini(document_text, deadline=None):
     prompt = f"""
 Extract the following fields strictly as JSON:
 - Full Name
@@ -215,27 +828,35 @@ Document Text:
 \"\"\"{document_text}\"\"\"
 """
 
-    model = genai.GenerativeModel('gemini-1.5-flash')
-
     try:
-        response = model.generate_content(
+        response_text = llm_generate(
+            TASK_EXTRACT_FIELDS,
+            'gemini-1.5-flash',
             prompt,
             generation_config={
                 "temperature": 0.2,
                 "response_mime_type": "application/json"
-            }
+            },
+            deadline=deadline,
         )
-        if response and response.text:
-            parsed_output = json.loads(response.text)
+        if response_text:
+            parsed_output = json.loads(response_text)
             return parsed_output
         else:
             return {}
+    except LLMDeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error in Gemini LLM extraction: {e}")
         return {}
 
 
 # ---------- Anomaly Detection (updated) ----------
+
+# Part of every cached report key and ETag: bump whenever a detect_*/validate_* rule or the
+# memo wording changes, so stored results and client caches are not served stale
+REPORT_RULES_VERSION = "2"
+
 def detect_cross_document_anomalies(extracted_data):
     anomalies = []
 
@@ -984,10 +1605,21 @@ def detect_bank_statement_cross_document_anomalies(extracted_data):
 
 
 
-def llm_full_page_analysis(document_text):
+# Bump whenever the llm_full_page_analysis prompt changes, so cached answers to the old prompt are not reused
+FULL_PAGE_ANALYSIS_PROMPT_VERSION = "1"
+FULL_PAGE_ANALYSIS_MODEL = 'gemini-2.0-flash-lite'
+
+def llm_full_page_analysis(document_text, use_cache=True, deadline=None, document_type=None):
     """
     Use Gemini to classify, extract fields, check missing fields, and confidence scores in one go.
+    With a known `document_type` the shorter per-type prompt is used instead (see llm_typed_analysis).
+    Answers are cached by model, prompt version and text hash; pass use_cache=False to force a fresh call.
+    `deadline` (time.monotonic()) bounds the call and its retries, see llm_generate.
     """
+    if document_type in DOCUMENT_TYPE_FIELDS:
+        return llm_typed_analysis(document_type, document_text, use_cache=use_cache, deadline=deadline)
+
+    cache_key = content_hash(FULL_PAGE_ANALYSIS_MODEL, FULL_PAGE_ANALYSIS_PROMPT_VERSION, document_text)
     prompt = f"""
 You are an intelligent document analyst part of the underwriting team in a bank. Based on the provided document text:
 
@@ -1052,26 +1684,444 @@ Document Text:
 {document_text}
 \"\"\"
 """
+    return _cached_analysis_call(prompt, cache_key, use_cache, deadline)
 
-    model = genai.GenerativeModel('gemini-2.0-flash-lite')
+def _cached_analysis_call(prompt, cache_key, use_cache, deadline):
+    # Stand-in backends give canned/replayed answers, which must not end up in the cache
+    cache = get_llm_cache() if use_cache and get_llm_backend().cacheable else None
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return json.loads(cached)
 
     try:
-        response = model.generate_content(
+        response_text = llm_generate(
+            TASK_PAGE_ANALYSIS,
+            FULL_PAGE_ANALYSIS_MODEL,
             prompt,
             generation_config={
                 "temperature": 0.2,
                 "response_mime_type": "application/json"
-            }
+            },
+            deadline=deadline,
         )
-        if response and response.text:
-            parsed_output = json.loads(response.text)
+        if response_text:
+            parsed_output = json.loads(response_text)
+            # Only well-formed answers are cached; failures are retried next time
+            if cache is not None:
+                cache.set(cache_key, response_text)
             return parsed_output
         else:
             return {}
+    except LLMDeadlineExceeded:
+        # Out of time for the whole document: fail the job rather than save empty results
+        raise
     except Exception as e:
         print(f"Error in Full Page Analysis Gemini call: {e}")
         return {}
-    
+
+# ---------- Per-Type Extraction ----------
+# Bump whenever a typed prompt or field list below changes
+TYPED_ANALYSIS_PROMPT_VERSION = "2"
+
+# (field, hint) per normalised document type: the lists the generic prompt spells out for all
+# five types on every call. Names match what the anomaly and validation checks look for,
+# including the dates, transactions and signature they read.
+DOCUMENT_TYPE_FIELDS = {
+    "ID Proof(Passport, Driving License)": [
+        ("Full name", ""),
+        ("Date of birth", ""),
+        ("Passport/Driving License number", ""),
+        ("Expiry date", ""),
+        ("Address", "residential address only, if available; not the place of birth"),
+    ],
+    "Payslip": [
+        ("Employer name", ""),
+        ("Employee name", ""),
+        ("Gross monthly income", ""),
+        ("Net monthly income", ""),
+        ("Tax/NI deductions", ""),
+        ("Address", "residential address of the employee only"),
+        ("National Insurance Number", "NI No"),
+        ("Pay Date", "date the payslip was issued or paid"),
+    ],
+    "P60": [
+        ("Annual gross income", ""),
+        ("Total tax paid", ""),
+        ("Employee name", ""),
+        ("Employer name", ""),
+        ("Address", "residential address of the employee only"),
+        ("National Insurance Number", "NI No"),
+        ("Tax Year Ending", "date the tax year on the P60 ends, like 5 April 2024"),
+    ],
+    "Bank Statement": [
+        ("Account holder name", ""),
+        ("Account number", ""),
+        ("Sort code", ""),
+        ("Monthly deposits", "income/salary credited per month"),
+        ("Monthly expenses", "sum of expenses for every month, like Jan:45 Feb:55"),
+        ("Overdraft usage", ""),
+        ("Address", "residential address of the account holder, not the employer's office"),
+        ("Transactions", "notable credits and debits with payee and amount, like 12/03 Tesco £12.50"),
+    ],
+    "Contract of Employment": [
+        ("Employee name", ""),
+        ("Employer name", ""),
+        ("Type of contract", "Permanent if nothing is mentioned; Fixed term contracts mention temporary terms"),
+        ("Job Start Date", ""),
+        ("Annual Salary", ""),
+        ("Address", ""),
+        ("Employee signature", "the signatory's name, or \"Signed\" if only a signature is present"),
+    ],
+}
+
+def build_typed_analysis_prompt(document_type, document_text):
+    fields = DOCUMENT_TYPE_FIELDS[document_type]
+    field_lines = "\n".join(f"- {name}" + (f" ({hint})" if hint else "") for name, hint in fields)
+    example = json.dumps({
+        "document_type": document_type,
+        "extracted_fields": {name: "..." for name, hint in fields},
+        "missing_fields": [],
+        "confidence_scores": {name: 0.9 for name, hint in fields},
+    })
+    return f"""
+You are an intelligent document analyst part of the underwriting team in a bank. The document below is a {document_type}.
+
+Tasks:
+1. Extract these fields:
+{field_lines}
+2. List the fields you could not find in missing_fields.
+3. Provide confidence scores (0 to 1) for each extracted field.
+
+Return strictly as JSON in this format, using exactly these field names:
+{example}
+
+Document Text:
+\"\"\"
+{document_text}
+\"\"\"
+"""
+
+def conform_to_schema(document_type, analysis):
+    """
+    Spell the type's own fields exactly as the schema does (matched case-insensitively) and
+    recompute missing_fields from them, so every typed answer has the same shape whatever the
+    model returned. Extra non-empty fields are kept as given: the checks may still read them.
+    """
+    names = {name.lower(): name for name, hint in DOCUMENT_TYPE_FIELDS[document_type]}
+    extracted, confidence_scores = {}, {}
+    for key, value in (analysis.get("extracted_fields") or {}).items():
+        key = str(key).strip()
+        name = names.get(key.lower(), key)
+        if name and name not in extracted and not _is_empty_field_value(value):
+            extracted[name] = value
+    for key, score in (analysis.get("confidence_scores") or {}).items():
+        key = str(key).strip()
+        name = names.get(key.lower(), key)
+        if name in extracted:
+            confidence_scores[name] = score
+    return {
+        "document_type": document_type,
+        "extracted_fields": extracted,
+        "missing_fields": [name for name in names.values() if name not in extracted],
+        "confidence_scores": confidence_scores,
+    }
+
+def llm_typed_analysis(document_type, document_text, use_cache=True, deadline=None):
+    """
+    Field extraction for text already known to be `document_type`: the prompt only lists that
+    type's fields, and the answer is conformed to them. Returns {} when the call fails;
+    LLMDeadlineExceeded propagates so the job fails instead of saving empty fields.
+    """
+    cache_key = content_hash(FULL_PAGE_ANALYSIS_MODEL, TYPED_ANALYSIS_PROMPT_VERSION, document_type, document_text)
+    prompt = build_typed_analysis_prompt(document_type, document_text)
+    analysis = _cached_analysis_call(prompt, cache_key, use_cache, deadline)
+    return conform_to_schema(document_type, analysis) if analysis else {}
+
+# ---------- Batched Classification ----------
+PAGE_CLASSIFICATION_PROMPT_VERSION = "1"
+PAGE_CLASSIFICATION_MODEL = 'gemini-2.0-flash-lite'
+PAGE_CLASSIFICATION_TYPES = ["Payslip", "Contract of Employment", "Bank Statement",
+                             "ID Proof(Passport, Driving License)", "P60", "Unknown"]
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting English OCR text
+    return len(text) // 4 + 1
+
+def build_classification_batches(texts, batch_size=None, max_tokens=None, head_chars=None):
+    """
+    Split page indices into batches of at most `batch_size` pages whose head samples fit
+    in `max_tokens`. Returns a list of index lists, in page order.
+    """
+    batch_size = batch_size or settings.LLM_CLASSIFY_BATCH_SIZE
+    max_tokens = max_tokens or settings.LLM_CLASSIFY_BATCH_MAX_TOKENS
+    head_chars = head_chars or settings.LLM_CLASSIFY_HEAD_CHARS
+
+    batches, current, current_tokens = [], [], 0
+    for idx, text in enumerate(texts):
+        tokens = estimate_tokens(text[:head_chars])
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(idx)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def llm_classify_pages_batch(texts, head_chars=None, deadline=None):
+    """
+    Classify several pages in one Gemini call from the first `head_chars` characters of each.
+    Returns a document type per input text, or None for pages the model didn't answer for.
+    """
+    head_chars = head_chars or settings.LLM_CLASSIFY_HEAD_CHARS
+    pages_block = "\n\n".join(
+        f"### Page {idx}\n\"\"\"\n{text[:head_chars]}\n\"\"\"" for idx, text in enumerate(texts)
+    )
+    prompt = f"""
+You are an intelligent document analyst part of the underwriting team in a bank.
+Classify each page below as exactly one of: {", ".join(PAGE_CLASSIFICATION_TYPES)}.
+Only the start of each page is shown.
+
+Return strictly as JSON in this format:
+{{
+  "pages": [
+    {{"index": 0, "document_type": "Payslip"}},
+    {{"index": 1, "document_type": "Bank Statement"}}
+  ]
+}}
+
+{pages_block}
+"""
+
+    results = [None] * len(texts)
+    try:
+        response_text = llm_generate(
+            TASK_CLASSIFY_PAGES,
+            PAGE_CLASSIFICATION_MODEL,
+            prompt,
+            generation_config={
+                "temperature": 0.0,
+                "response_mime_type": "application/json"
+            },
+            deadline=deadline,
+        )
+        if response_text:
+            for entry in json.loads(response_text).get("pages", []):
+                idx = entry.get("index")
+                if isinstance(idx, int) and 0 <= idx < len(texts):
+                    results[idx] = entry.get("document_type")
+    except LLMDeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"Error in batched classification Gemini call: {e}")
+    return results
+
+# ---------- Prompt Text Compaction ----------
+_HORIZONTAL_SPACE_RE = re.compile(r"[ \t\f\v\u00a0]+")
+# Lines made only of separators: table rulings and box edges read as characters
+_RULING_LINE_RE = re.compile(r"^[-_=|+.:;*~#'`\"\\/\[\](){}<>\s]*$")
+
+def _compact_lines(text):
+    lines = []
+    for line in text.splitlines():
+        line = _HORIZONTAL_SPACE_RE.sub(" ", line).strip()
+        if line and not _RULING_LINE_RE.match(line):
+            lines.append(line)
+    return lines
+
+def cap_text(text, max_tokens):
+    """
+    Trim `text` to about `max_tokens`, keeping the head and a shorter tail (totals and
+    closing balances tend to sit at the end of a page).
+    """
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * 4
+    head = text[: max_chars * 2 // 3].rsplit("\n", 1)[0]
+    tail = text[-(max_chars // 3):].split("\n", 1)[-1]
+    return f"{head}\n[...]\n{tail}"
+
+def compact_page_text(text, max_tokens=None):
+    """
+    OCR text as it should go into a prompt: whitespace runs collapsed, blank and ruling-only
+    lines dropped, and the page capped at PROMPT_PAGE_TOKEN_BUDGET.
+    """
+    max_tokens = settings.PROMPT_PAGE_TOKEN_BUDGET if max_tokens is None else max_tokens
+    return cap_text("\n".join(_compact_lines(text)), max_tokens)
+
+# Amounts, dates and reference numbers: never mistaken for a running header
+_NUMERIC_LINE_RE = re.compile(r"^[£$€\d.,:/%+\-\s]+$")
+
+def _edge_positions(lines, edge_lines):
+    """{line index: position} for the lines near the top (0, 1, ...) or bottom (-1, -2, ...)."""
+    positions = {}
+    for offset in range(min(edge_lines, len(lines))):
+        positions[len(lines) - 1 - offset] = -1 - offset
+    for offset in range(min(edge_lines, len(lines))):
+        positions[offset] = offset
+    return positions
+
+def compact_group_texts(texts, edge_lines=None, max_tokens=None):
+    """
+    compact_page_text for the pages of one group, plus running headers and footers: a line
+    found at the same position within `edge_lines` of the top or bottom of most of the
+    group's pages is kept on the first of them only. Numeric-only lines are always kept.
+    Returns one text per page.
+    """
+    edge_lines = settings.PROMPT_REPEAT_EDGE_LINES if edge_lines is None else edge_lines
+    max_tokens = settings.PROMPT_PAGE_TOKEN_BUDGET if max_tokens is None else max_tokens
+
+    pages = [_compact_lines(text) for text in texts]
+    page_edges = []
+    edge_counts = defaultdict(int)
+    for lines in pages:
+        edges = {
+            idx: (position, lines[idx].lower())
+            for idx, position in _edge_positions(lines, edge_lines).items()
+            if not _NUMERIC_LINE_RE.match(lines[idx])
+        }
+        page_edges.append(edges)
+        for key in set(edges.values()):
+            edge_counts[key] += 1
+
+    # "Most pages": more than half of them, and never a line seen on a single page
+    repeated = {key for key, count in edge_counts.items() if count >= 2 and count * 2 > len(pages)}
+    seen = set()
+    compacted = []
+    for lines, edges in zip(pages, page_edges):
+        kept = []
+        for idx, line in enumerate(lines):
+            key = edges.get(idx)
+            if key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        compacted.append(cap_text("\n".join(kept), max_tokens))
+    return compacted
+
+# ---------- Merging Per-Page Analyses ----------
+_EMPTY_FIELD_VALUES = {"", "null", "none", "not found", "n/a", "na", "unknown"}
+
+def _is_empty_field_value(value):
+    if value is None:
+        return True
+    if isinstance(value, (list, dict)):
+        return not value
+    return str(value).strip().lower() in _EMPTY_FIELD_VALUES
+
+def _normalise_field_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True).lower()
+    return " ".join(str(value).lower().split())
+
+def _confidence(scores, field):
+    try:
+        return float(scores.get(field, 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def merge_page_analyses(analyses):
+    """
+    Deterministically merge the per-page llm_full_page_analysis results of one document group.
+
+    Field names are matched case-insensitively, keeping the first spelling seen. For every
+    field the non-empty value with the highest confidence wins, the earliest page breaking
+    ties. Returns (merged_analysis, conflicts) where `conflicts` lists the fields whose pages
+    disagree; merged_analysis["missing_fields"] lists fields some page reported missing that
+    no page supplied.
+    """
+    spellings = {}
+    values = {}
+    best_scores = {}
+    seen_values = {}
+    reported_missing = {}
+
+    for analysis in analyses:
+        fields = analysis.get("extracted_fields") or {}
+        scores = {str(field).strip().lower(): score for field, score in (analysis.get("confidence_scores") or {}).items()}
+        for field, value in fields.items():
+            if _is_empty_field_value(value):
+                continue
+            key = str(field).strip().lower()
+            spellings.setdefault(key, str(field).strip())
+            seen_values.setdefault(key, set()).add(_normalise_field_value(value))
+            score = _confidence(scores, key)
+            if key not in values or score > best_scores[key]:
+                values[key] = value
+                best_scores[key] = score
+        for field in analysis.get("missing_fields") or []:
+            reported_missing.setdefault(str(field).strip().lower(), field)
+
+    extracted_fields = {spellings[key]: value for key, value in values.items()}
+    confidence_scores = {spellings[key]: score for key, score in best_scores.items()}
+    missing_fields = [field for key, field in reported_missing.items() if key not in values]
+    conflicts = [spellings[key] for key, field_values in seen_values.items() if len(field_values) > 1]
+
+    merged = {
+        "document_type": analyses[0].get("document_type") if analyses else "unknown",
+        "extracted_fields": extracted_fields,
+        "confidence_scores": confidence_scores,
+        "missing_fields": missing_fields,
+    }
+    return merged, conflicts
+
+# ---------- Map-Reduce Extraction ----------
+# Fields holding one figure per month ("Jan:2630.00, Feb:2630.00"); partial values from
+# separate page windows are added up month by month instead of picking one window's answer
+MONTHLY_FIELDS = {"monthly deposits", "monthly expenses"}
+_MONTH_NAMES = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_MONTH_AMOUNT_RE = re.compile(r"([A-Za-z]{3,9})(?:[ \-/']*(\d{2,4}))?\s*[:=]\s*£?\s*(-?[\d,]*\.?\d+)")
+
+def parse_monthly_amounts(value):
+    """
+    {"Jan": 2630.0, "Feb 2024": 15.5, ...} in document order, from a 'Jan:2630.00, Feb:...'
+    string, a {"Jan": "2630.00"} dict or a list of either.
+    """
+    if isinstance(value, dict):
+        value = ", ".join(f"{month}:{amount}" for month, amount in value.items())
+    elif isinstance(value, list):
+        value = ", ".join(str(entry) for entry in value)
+    amounts = {}
+    for month, year, amount in _MONTH_AMOUNT_RE.findall(str(value or "")):
+        if month[:3].lower() not in _MONTH_NAMES:
+            continue
+        label = month[:3].title() + (f" {year}" if year else "")
+        try:
+            amounts[label] = amounts.get(label, 0.0) + float(amount.replace(",", ""))
+        except ValueError:
+            continue
+    return amounts
+
+def format_monthly_amounts(amounts):
+    return ", ".join(f"{month}:{amount:.2f}" for month, amount in amounts.items())
+
+def reduce_window_analyses(analyses):
+    """
+    Combine the analyses of consecutive page windows of one group into a single result.
+    Monthly figures are summed per month across windows (a month split over two windows
+    contributes from both); every other field is merged as in merge_page_analyses.
+    Returns (merged_analysis, conflicts).
+    """
+    merged, conflicts = merge_page_analyses(analyses)
+    # Totals go under the spelling the merge kept for the field
+    spellings = {field.strip().lower(): field for field in merged["extracted_fields"]}
+    monthly = {}
+    for analysis in analyses:
+        for field, value in (analysis.get("extracted_fields") or {}).items():
+            key = str(field).strip().lower()
+            if key not in MONTHLY_FIELDS:
+                continue
+            totals = monthly.setdefault(spellings.get(key, field), {})
+            for month, amount in parse_monthly_amounts(value).items():
+                totals[month] = totals.get(month, 0.0) + amount
+
+    for field, totals in monthly.items():
+        if totals:
+            merged["extracted_fields"][field] = format_monthly_amounts(totals)
+    return merged, [field for field in conflicts if field.lower() not in MONTHLY_FIELDS]
+
     # ---------- Salary and Amount Cleaning ----------
 def clean_salary_value(value):
     """
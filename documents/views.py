@@ -4,58 +4,321 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 import json
 
-import os
-from collections import defaultdict
+from functools import wraps
 import traceback
 
 from .models import CustomerDocumentUpload, PageAnalysis
 from .serializers import CustomerDocumentUploadSerializer
+from .cache import content_hash
+from .processing import enqueue_document_upload
 from .utils import (
-    split_pdf_into_pages,
-    easyocr_text_from_pdf,
-    merge_pdfs,
     check_page_quality,
-    check_ocr_completeness,
     detect_cross_document_anomalies,
     detect_p60_cross_document_anomalies,
     detect_contract_cross_document_anomalies,
-    llm_full_page_analysis,
     generate_memo_from_fields,
-    detect_bank_statement_cross_document_anomalies
+    detect_bank_statement_cross_document_anomalies,
+    clean_salary_value,
+    validate_payslip,
+    validate_contract,
+    validate_bank_statement,
+    validate_p60,
+    get_report_cache,
+    REPORT_RULES_VERSION,
 )
 
-# ====== Testing Flag ======
-TESTING_MODE = False  # 🔵 Set to False for production
+# ---------- Report Sections ----------
+# Each builder returns the body of its endpoint; `report` combines several of them while
+# loading the upload and its pages only once.
 
-# Dummy document types to assign in testing mode
-DUMMY_DOCUMENT_TYPES = [
-    "ID Proof(Passport, Driving License)",
-    "Bank Statement",
-    "Contract of Employment",
-    "Contract of Employment",
-    "P60",
-    "Payslip"
-]
+def report_pages(document):
+    """The upload's pages with their groups, without the OCR text no report uses."""
+    return list(document.pages.select_related("group").defer("ocr_text"))
 
-def normalize_document_type(doc_type):
+
+def wants_recompute(request):
+    return request.query_params.get("recompute", "").lower() in ("1", "true", "yes")
+
+
+def report_stamp(document):
+    """When the upload's report inputs last changed (uploads processed before it was tracked fall back to the upload time)."""
+    return document.pages_updated_at or document.uploaded_at
+
+
+def cached_report(section):
+    """
+    Keeps a report builder's result in the report cache until the upload's pages are
+    rewritten or REPORT_RULES_VERSION changes.
     """
-    Normalize document type variations to a standard.
+    def decorator(build):
+        @wraps(build)
+        def wrapper(document):
+            cache = get_report_cache()
+            if cache is None:
+                return build(document)
+
+            key = content_hash("report", section, str(document.id), report_stamp(document).isoformat(), REPORT_RULES_VERSION)
+            cached = cache.get(key)
+            if cached is not None:
+                return json.loads(cached)
+            result = build(document)
+            cache.set(key, json.dumps(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def conditional_report(request, document, build, *variant, check=True):
     """
-    doc_type = doc_type.lower()
-    if "contract of employement" in doc_type or "contract of employment" in doc_type:
-        return "Contract of Employment"
-    if "id proof" in doc_type or "passport" in doc_type or "driving license" in doc_type:
-        return "ID Proof(Passport, Driving License)"
-    if "bank statement" in doc_type:
-        return "Bank Statement"
-    if "p60" in doc_type:
-        return "P60"
-    if "payslip" in doc_type:
-        return "Payslip"
-    return doc_type.title()
+    Response for a report on `document`, with an ETag and Last-Modified derived from the
+    upload's pages and the rules version. A client whose copy is still current gets a 304
+    without the report being built; `check=False` always builds it (e.g. on recompute).
+    """
+    def validators():
+        stamp = report_stamp(document)
+        etag = quote_etag(content_hash(str(document.id), stamp.isoformat(), REPORT_RULES_VERSION, *variant)[:32])
+        return etag, int(stamp.timestamp())
+
+    etag, last_modified = validators()
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified) if check else None
+    if response is None:
+        response = Response(build(), status=status.HTTP_200_OK)
+        # A quality recompute moves the stamp while building
+        etag, last_modified = validators()
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Let browsers keep the copy but revalidate it every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def quality_report(document, pages, recompute=False):
+    pages = sorted(pages, key=lambda page: page.page_number)
+
+    # Nothing is stored until the upload's job has finished; don't render the PDF meanwhile
+    if not pages:
+        return {
+            "document_id": document.id,
+            "file_name": document.original_file.name,
+            "total_pages": 0,
+            "source": "pending",
+            "quality_report": []
+        }
+
+    # Served from the metrics stored at ingest; re-render only on request or for
+    # uploads processed before quality was persisted
+    if recompute or any(page.blur_score is None for page in pages):
+        quality_results = check_page_quality(document.original_file.path)
+        pages_by_number = {page.page_number: page for page in pages}
+        updated = []
+        for result in quality_results:
+            page = pages_by_number.get(result["page"])
+            if page is None:
+                continue
+            page.is_blurry = result["blurry"]
+            page.blur_score = result["blur_score"]
+            page.is_blank = result["blank"]
+            page.blank_score = result["blank_score"]
+            page.blurry_tile_ratio = result["blurry_tile_ratio"]
+            updated.append(page)
+        if updated:
+            PageAnalysis.objects.bulk_update(updated, ["is_blurry", "blur_score", "is_blank", "blank_score", "blurry_tile_ratio"])
+            document.pages_updated_at = timezone.now()
+            document.save(update_fields=["pages_updated_at"])
+        source = "recomputed"
+    else:
+        quality_results = [{
+            "page": page.page_number,
+            "blurry": page.is_blurry,
+            "blur_score": page.blur_score,
+            "blank": page.is_blank,
+            "blank_score": page.blank_score,
+            "blurry_tile_ratio": page.blurry_tile_ratio,
+        } for page in pages]
+        source = "stored"
+
+    return {
+        "document_id": document.id,
+        "file_name": document.original_file.name,
+        "total_pages": len(quality_results),
+        "source": source,
+        "quality_report": quality_results
+    }
+
+
+def ocr_check_report(document, pages):
+    classified_pages = []
+    for page in pages:
+        classified_pages.append({
+            "page_path": page.page_path,
+            "document_type": page.document_type,
+            "extraction_method": page.extraction_method,
+            "missing_fields": (page.group.missing_fields if page.group else None) or []
+        })
+
+    return {
+        "document_id": document.id,
+        "file_name": document.original_file.name,
+        "ocr_check_report": classified_pages
+    }
+
+
+@cached_report("anomalies")
+def anomaly_report(document):
+    extracted_data = document.extracted_data or {}
+
+    # === 🔥 Anomaly Checks ===
+    # 1. Payslip (old one)
+    inter_document_checks_result, intra_document_anomalies = detect_cross_document_anomalies(extracted_data)
+
+    # 2. P60-specific
+    p60_checks, p60_anomalies = detect_p60_cross_document_anomalies(extracted_data)
+
+    # 3. Contract of Employment-specific
+    contract_checks, contract_anomalies = detect_contract_cross_document_anomalies(extracted_data)
+
+    # 4. Bank Statement
+    bank_checks, bank_anomalies = detect_bank_statement_cross_document_anomalies(extracted_data)
+
+    # === Merge all results ===
+    inter_document_checks_result.update(p60_checks)
+    inter_document_checks_result.update(contract_checks)
+    inter_document_checks_result.update(bank_checks)
+
+    intra_document_anomalies.extend(p60_anomalies)
+    intra_document_anomalies.extend(contract_anomalies)
+    intra_document_anomalies.extend(bank_anomalies)
+
+    return {
+        "document_id": document.id,
+        "document_type": document.main_document_type or "Unknown",
+        "inter_document_checks": inter_document_checks_result,
+        "intra_document_anomalies": intra_document_anomalies,
+    }
+
+
+def field_extraction_report(document, pages):
+    extracted_results = []
+    for page in pages:
+        group = page.group
+        extracted_results.append({
+            "page_number": page.page_number,
+            "page_path": page.page_path,
+            "document_type": page.document_type,
+            "fields_extracted": (group.extracted_fields if group else None) or {},
+            "confidence_scores": (group.confidence_scores if group else None) or {},
+            # Page ranges whose extraction failed; the group's fields are partial when set
+            "failed_windows": (group.failed_windows if group else None) or []
+        })
+
+    return {
+        "document_id": document.id,
+        "file_name": document.original_file.name,
+        "field_extraction_report": extracted_results
+    }
+
+
+def memo_report(document):
+    # Build the memo from the upload's extracted data
+    memo_text = generate_memo_from_fields(document.extracted_data or {})
+
+    return {
+        "document_id": document.id,
+        "memo_text": memo_text
+    }
+
+
+@cached_report("data_validation")
+def data_validation_report(document):
+    extracted_data = document.extracted_data or {}
+
+    payslip_data = extracted_data.get("Payslip", {})
+    contract_data = extracted_data.get("Contract of Employment", {})
+
+    gross_monthly_str = payslip_data.get("Gross monthly income", "")
+    contract_annual_str = contract_data.get("Annual Salary", "")
+
+    gross_monthly = clean_salary_value(gross_monthly_str)
+    contract_annual = clean_salary_value(contract_annual_str)
+
+    if gross_monthly is None or contract_annual is None:
+        return {
+            "document_id": document.id,
+            "status": "Incomplete",
+            "note": "Missing gross monthly income or annual contract salary data."
+        }
+
+    calculated_annual = round(gross_monthly * 12, 2)
+    status_str = "Verified ✅" if abs(calculated_annual - contract_annual) < 100 else "Mismatch ❌"
+
+    validation_note = (
+        f"Total gross pay is £{gross_monthly:.2f}. When calculated annually, "
+        f"it is £{calculated_annual:.2f}. Income on contract is £{contract_annual:.2f}. "
+        f"Hence verified using contract. ({status_str})"
+    )
+
+    return {
+        "document_id": document.id,
+        "gross_monthly": f"£{gross_monthly:.2f}",
+        "calculated_annual": f"£{calculated_annual:.2f}",
+        "contract_annual": f"£{contract_annual:.2f}",
+        "status": status_str,
+        "note": validation_note
+    }
+
+
+@cached_report("ocr_detailed_check")
+def ocr_detailed_report(document):
+    extracted_data = document.extracted_data or {}
+
+    validation_results = {}
+
+    print("\n=== Starting OCR Detailed Check ===")
+
+    for doc_type, fields in extracted_data.items():
+        checks = {}
+        doc_type_lower = doc_type.lower()
+
+        print(f"\nChecking document: {doc_type}")
+
+        if "payslip" in doc_type_lower:
+            checks = validate_payslip(fields)
+        elif "bank statement" in doc_type_lower:
+            checks = validate_bank_statement(fields)
+        elif "contract" in doc_type_lower:
+            checks = validate_contract(fields)
+        elif "p60" in doc_type_lower:
+            checks = validate_p60(fields)
+
+        if checks:
+            validation_results[doc_type] = checks
+
+    print("\n=== Completed OCR Detailed Check ===")
+    print(f"Validation Results: {json.dumps(validation_results, indent=2)}\n")
+
+    return {
+        "document_id": document.id,
+        "ocr_detailed_check": validation_results
+    }
+
+
+# Sections of the combined `report` endpoint, in response order
+REPORT_SECTIONS = {
+    "anomalies": anomaly_report,
+    "ocr_check": ocr_check_report,
+    "ocr_detailed_check": ocr_detailed_report,
+    "field_extraction": field_extraction_report,
+    "quality": quality_report,
+    "memo": memo_report,
+    "data_validation": data_validation_report,
+}
+PAGE_SECTIONS = {"ocr_check", "field_extraction", "quality"}
 
 class CustomerDocumentUploadViewSet(viewsets.ModelViewSet):
     queryset = CustomerDocumentUpload.objects.all()
@@ -65,99 +328,51 @@ class CustomerDocumentUploadViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = self.perform_create(serializer)
+
+        data = dict(serializer.data)
+        data["job_id"] = job.id
+        data["job_status"] = job.status
+        headers = self.get_success_headers(serializer.data)
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
     def perform_create(self, serializer):
         instance = serializer.save(user=self.request.user)
-
-        print("\n🛠️  === STARTING DOCUMENT PROCESSING ===\n")
-
-        original_pdf_path = instance.original_file.path
-        output_folder = os.path.join(settings.MEDIA_ROOT, 'uploads', 'splits', f"{instance.id}")
-        os.makedirs(output_folder, exist_ok=True)
-
-        split_pages = split_pdf_into_pages(original_pdf_path, output_folder)
-
-        page_data = []
-
-        for idx, page_path in enumerate(split_pages):
-            extracted_text = easyocr_text_from_pdf(page_path)
-
-            if TESTING_MODE:
-                document_type = DUMMY_DOCUMENT_TYPES[idx % len(DUMMY_DOCUMENT_TYPES)]
-            else:
-                analysis = llm_full_page_analysis(extracted_text)
-                document_type = analysis.get('document_type', 'unknown')
-
-            normalized_doc_type = normalize_document_type(document_type)
-
-            print(f"📄 Page {idx+1} ({os.path.basename(page_path)}): Classified as ➡️  [{normalized_doc_type}]")
-
-            page_data.append({
-                "page_number": idx + 1,
-                "page_path": os.path.relpath(page_path, settings.MEDIA_ROOT),
-                "document_type": normalized_doc_type,
-                "ocr_text": extracted_text,
-            })
-
-        # Group pages by normalized document type
-        grouped_docs = defaultdict(list)
-        for page in page_data:
-            grouped_docs[page["document_type"]].append(page)
-
-        print("\n📚 === GROUPED DOCUMENTS SUMMARY ===")
-        for doc_type, pages in grouped_docs.items():
-            page_names = [os.path.basename(p['page_path']) for p in pages]
-            print(f"✅ {doc_type}: {len(pages)} page(s) -> {page_names}")
-        print("======================================\n")
-
-        # For each document type, merge text and call LLM once
-        for document_type, pages in grouped_docs.items():
-            combined_text = "\n\n".join([p["ocr_text"] for p in pages])
-
-            if TESTING_MODE:
-                analysis = {
-                    "document_type": document_type,
-                    "extracted_fields": {
-                        "Full Name": "John Doe",
-                        "Salary Amount": "5000"
-                    },
-                    "confidence_scores": {
-                        "Full Name": 0.95,
-                        "Salary Amount": 0.92
-                    },
-                    "missing_fields": []
-                }
-            else:
-                analysis = llm_full_page_analysis(combined_text)
-
-            for page in pages:
-                PageAnalysis.objects.create(
-                    document=instance,
-                    page_number=page["page_number"],
-                    page_path=page["page_path"],
-                    document_type=document_type,
-                    extracted_fields=analysis.get('extracted_fields', {}),
-                    confidence_scores=analysis.get('confidence_scores', {}),
-                    missing_fields=analysis.get('missing_fields', []),
-                    ocr_text=page["ocr_text"]
-                )
-
-        instance.processed = True
-        instance.save()
-
-        print("\n✅ === UPLOAD PROCESSED AND SAVED SUCCESSFULLY ===\n")
+        job = enqueue_document_upload(instance)
+
+        print(f"\n📨 Upload {instance.id} queued for processing as job {job.id}\n")
+        return job
+
+    @action(detail=True, methods=["get"], url_path="status")
+    def processing_status(self, request, pk=None):
+        document = self.get_object()
+        job = document.jobs.order_by("-created_at").first()
+
+        return Response({
+            "document_id": document.id,
+            "processed": document.processed,
+            "job_id": job.id if job else None,
+            "status": job.status if job else None,
+            "attempts": job.attempts if job else 0,
+            "error": job.error if job else None,
+            "created_at": job.created_at if job else None,
+            "started_at": job.started_at if job else None,
+            "finished_at": job.finished_at if job else None,
+        }, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["get"], url_path="quality-check")
     def quality_check(self, request, pk=None):
         try:
             document = self.get_object()
-            quality_results = check_page_quality(document.original_file.path)
-
-            return Response({
-                "document_id": document.id,
-                "file_name": document.original_file.name,
-                "total_pages": len(quality_results),
-                "quality_report": quality_results
-            }, status=status.HTTP_200_OK)
+            recompute = wants_recompute(request)
+            return conditional_report(
+                request, document,
+                lambda: quality_report(document, report_pages(document), recompute=recompute),
+                "quality-check", check=not recompute,
+            )
 
         except Exception as e:
             traceback.print_exc()
@@ -167,21 +382,7 @@ class CustomerDocumentUploadViewSet(viewsets.ModelViewSet):
     def ocr_check(self, request, pk=None):
         try:
             document = self.get_object()
-            pages = document.pages.all()
-
-            classified_pages = []
-            for page in pages:
-                classified_pages.append({
-                    "page_path": page.page_path,
-                    "document_type": page.document_type,
-                    "missing_fields": page.missing_fields or []
-                })
-
-            return Response({
-                "document_id": document.id,
-                "file_name": document.original_file.name,
-                "ocr_check_report": classified_pages
-            }, status=status.HTTP_200_OK)
+            return conditional_report(request, document, lambda: ocr_check_report(document, report_pages(document)), "ocr-check")
 
         except Exception as e:
             traceback.print_exc()
@@ -192,44 +393,7 @@ class CustomerDocumentUploadViewSet(viewsets.ModelViewSet):
     def anomaly_check(self, request, pk=None):
         try:
             document = self.get_object()
-            pages = document.pages.all()
-
-            extracted_data = {}
-            for page in pages:
-                doc_type = page.document_type or f"unknown_page_{page.page_number}"
-                extracted_data[doc_type] = page.extracted_fields or {}
-
-            # === 🔥 Anomaly Checks ===
-            # 1. Payslip (old one)
-            inter_document_checks_result, intra_document_anomalies = detect_cross_document_anomalies(extracted_data)
-
-            # 2. P60-specific
-            p60_checks, p60_anomalies = detect_p60_cross_document_anomalies(extracted_data)
-
-            # 3. Contract of Employment-specific
-            contract_checks, contract_anomalies = detect_contract_cross_document_anomalies(extracted_data)
-
-            # 4. Bank Statement
-            bank_checks, bank_anomalies = detect_bank_statement_cross_document_anomalies(extracted_data)
-
-            # === Merge all results ===
-            inter_document_checks_result.update(p60_checks)
-            inter_document_checks_result.update(contract_checks)
-            inter_document_checks_result.update(bank_checks)
-
-
-            intra_document_anomalies.extend(p60_anomalies)
-            intra_document_anomalies.extend(contract_anomalies)
-            intra_document_anomalies.extend(bank_anomalies)
-            
-            main_document_type = pages.first().document_type if pages.exists() else "Unknown"
-
-            return Response({
-                "document_id": document.id,
-                "document_type": main_document_type,
-                "inter_document_checks": inter_document_checks_result,
-                "intra_document_anomalies": intra_document_anomalies,
-            }, status=status.HTTP_200_OK)
+            return conditional_report(request, document, lambda: anomaly_report(document), "anomaly-check")
 
         except Exception as e:
             traceback.print_exc()
@@ -239,23 +403,7 @@ class CustomerDocumentUploadViewSet(viewsets.ModelViewSet):
     def field_extraction(self, request, pk=None):
         try:
             document = self.get_object()
-            pages = document.pages.all()
-
-            extracted_results = []
-            for page in pages:
-                extracted_results.append({
-                    "page_number": page.page_number,
-                    "page_path": page.page_path,
-                    "document_type": page.document_type,
-                    "fields_extracted": page.extracted_fields or {},
-                    "confidence_scores": page.confidence_scores or {}
-                })
-
-            return Response({
-                "document_id": document.id,
-                "file_name": document.original_file.name,
-                "field_extraction_report": extracted_results
-            }, status=status.HTTP_200_OK)
+            return conditional_report(request, document, lambda: field_extraction_report(document, report_pages(document)), "field-extraction")
 
         except Exception as e:
             traceback.print_exc()
@@ -265,21 +413,7 @@ class CustomerDocumentUploadViewSet(viewsets.ModelViewSet):
     def generate_memo(self, request, pk=None):
         try:
             document = self.get_object()
-            pages = document.pages.all()
-
-            # Organize data for memo generation
-            extracted_data = {}
-            for page in pages:
-                doc_type = page.document_type or f"unknown_page_{page.page_number}"
-                extracted_data[doc_type] = page.extracted_fields or {}
-
-            # Call the utility function to build the memo
-            memo_text = generate_memo_from_fields(extracted_data)
-
-            return Response({
-                "document_id": document.id,
-                "memo_text": memo_text
-            }, status=status.HTTP_200_OK)
+            return conditional_report(request, document, lambda: memo_report(document), "memo")
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -288,51 +422,9 @@ class CustomerDocumentUploadViewSet(viewsets.ModelViewSet):
     def data_validation(self, request, pk=None):
         try:
             document = self.get_object()
-            pages = document.pages.all()
-
-            extracted_data = {}
-            for page in pages:
-                doc_type = page.document_type or f"unknown_page_{page.page_number}"
-                extracted_data[doc_type] = page.extracted_fields or {}
-
-            payslip_data = extracted_data.get("Payslip", {})
-            contract_data = extracted_data.get("Contract of Employment", {})
-
-            gross_monthly_str = payslip_data.get("Gross monthly income", "")
-            contract_annual_str = contract_data.get("Annual Salary", "")
-
-            from .utils import clean_salary_value  # make sure it's imported
-
-            gross_monthly = clean_salary_value(gross_monthly_str)
-            contract_annual = clean_salary_value(contract_annual_str)
-
-            if gross_monthly is None or contract_annual is None:
-                return Response({
-                    "document_id": document.id,
-                    "status": "Incomplete",
-                    "note": "Missing gross monthly income or annual contract salary data."
-                }, status=status.HTTP_200_OK)
-
-            calculated_annual = round(gross_monthly * 12, 2)
-            status_str = "Verified ✅" if abs(calculated_annual - contract_annual) < 100 else "Mismatch ❌"
-
-            validation_note = (
-                f"Total gross pay is £{gross_monthly:.2f}. When calculated annually, "
-                f"it is £{calculated_annual:.2f}. Income on contract is £{contract_annual:.2f}. "
-                f"Hence verified using contract. ({status_str})"
-            )
-
-            return Response({
-                "document_id": document.id,
-                "gross_monthly": f"£{gross_monthly:.2f}",
-                "calculated_annual": f"£{calculated_annual:.2f}",
-                "contract_annual": f"£{contract_annual:.2f}",
-                "status": status_str,
-                "note": validation_note
-            }, status=status.HTTP_200_OK)
+            return conditional_report(request, document, lambda: data_validation_report(document), "data-validation")
 
         except Exception as e:
-            import traceback
             traceback.print_exc()
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
@@ -340,46 +432,48 @@ class CustomerDocumentUploadViewSet(viewsets.ModelViewSet):
     def ocr_detailed_check(self, request, pk=None):
         try:
             document = self.get_object()
-            pages = document.pages.all()
+            return conditional_report(request, document, lambda: ocr_detailed_report(document), "ocr-detailed-check")
 
-            extracted_data = {}
-            for page in pages:
-                doc_type = page.document_type or f"unknown_page_{page.page_number}"
-                extracted_data[doc_type] = page.extracted_fields or {}
-
-            from .utils import validate_payslip, validate_contract, validate_bank_statement, validate_p60
-
-            validation_results = {}
-
-            print("\n=== Starting OCR Detailed Check ===")
+        except Exception as e:
+            traceback.print_exc()
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            for doc_type, fields in extracted_data.items():
-                checks = {}
-                doc_type_lower = doc_type.lower()
+    @action(detail=True, methods=["get"], url_path="report")
+    def report(self, request, pk=None):
+        """
+        Every dashboard section in one response, built from a single load of the upload and
+        its pages. `?sections=memo,quality` returns just those sections.
+        """
+        try:
+            document = self.get_object()
 
-                print(f"\nChecking document: {doc_type}")
+            requested = request.query_params.get("sections")
+            sections = [name.strip() for name in requested.split(",") if name.strip()] if requested else list(REPORT_SECTIONS)
+            unknown = [name for name in sections if name not in REPORT_SECTIONS]
+            if unknown:
+                return Response({
+                    "error": f"Unknown report sections: {', '.join(unknown)}",
+                    "available_sections": list(REPORT_SECTIONS),
+                }, status=status.HTTP_400_BAD_REQUEST)
 
-                if "payslip" in doc_type_lower:
-                    checks = validate_payslip(fields)
-                elif "bank statement" in doc_type_lower:
-                    checks = validate_bank_statement(fields)
-                elif "contract" in doc_type_lower:
-                    checks = validate_contract(fields)
-                elif "p60" in doc_type_lower:
-                    checks = validate_p60(fields)
+            recompute = wants_recompute(request)
 
-                if checks:
-                    validation_results[doc_type] = checks
+            def build():
+                # Only the page-level sections need the pages, and they share one query
+                pages = report_pages(document) if PAGE_SECTIONS.intersection(sections) else None
 
-            print("\n=== Completed OCR Detailed Check ===")
-            print(f"Validation Results: {json.dumps(validation_results, indent=2)}\n")
+                result = {"document_id": document.id, "file_name": document.original_file.name}
+                for name in sections:
+                    if name == "quality":
+                        result[name] = quality_report(document, pages, recompute=recompute)
+                    elif name in PAGE_SECTIONS:
+                        result[name] = REPORT_SECTIONS[name](document, pages)
+                    else:
+                        result[name] = REPORT_SECTIONS[name](document)
+                return result
 
-            return Response({
-                "document_id": document.id,
-                "ocr_detailed_check": validation_results
-            }, status=status.HTTP_200_OK)
+            return conditional_report(request, document, build, "report", *sections, check=not recompute)
 
         except Exception as e:
-            import traceback
             traceback.print_exc()
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -34,15 +34,32 @@ async function uploadSingleFile(file) {
     if (!response.ok) throw new Error("Upload failed!");
 
     const data = await response.json();
+    document.getElementById("uploadStatus").innerText = `Processing ${file.name}...`;
+
+    const job = await waitForProcessing(data.id);
+    if (job.status !== "done") throw new Error(job.error || "Processing failed!");
+
     uploadedDocuments.push({ id: data.id, name: file.name });
     updateUploadedFilesList();
     document.getElementById("uploadStatus").innerText = "Upload successful!";
   } catch (error) {
     console.error(error);
+    document.getElementById("uploadStatus").innerText = `${file.name}: ${error.message}`;
     alert(`Failed to upload ${file.name}`);
   }
 }
 
+// Poll the ingestion job until the worker finishes with it, giving up after timeoutMs
+async function waitForProcessing(documentId, intervalMs = 3000, timeoutMs = 15 * 60 * 1000) {
+  const giveUpAt = Date.now() + timeoutMs;
+  while (Date.now() < giveUpAt) {
+    const job = await callApi(`/documents/${documentId}/status/`);
+    if (job.status === "done" || job.status === "failed") return job;
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+  return { status: "timeout", error: "Processing is taking longer than expected; try again later." };
+}
+
 function getSeverityEmoji(severity) {
   switch (severity) {
     case "High": return "🔴";
@@ -69,14 +86,18 @@ function updateUploadedFilesList() {
   });
 }
 
-// Load all tabs
-function loadAllTabResults() {
-  fetchAnomalies();
-  fetchOCRCheck();
-  fetchFieldExtraction();
-  fetchQualityReport();
-  fetchMemo();
-  fetchDataValidation();
+// Load all tabs from one combined report request
+async function loadAllTabResults() {
+  if (!currentDocumentId) return;
+  ["anomaly", "ocr", "field", "quality", "memo", "validation"].forEach(setLoading);
+
+  const report = await callApi(`/documents/${currentDocumentId}/report/`);
+  renderAnomalies(report.anomalies || {});
+  renderOCRCheck(report.ocr_check || {}, report.ocr_detailed_check || {});
+  renderFieldExtraction(report.field_extraction || {});
+  renderQualityReport(report.quality || {});
+  renderMemo(report.memo || {});
+  renderDataValidation(report.data_validation || {});
 }
 
 // API Caller
@@ -99,39 +120,6 @@ function setLoading(tabId) {
   container.innerHTML = `<div class="loading-spinner"></div>`;
 }
 
-// Fetch for each tab
-async function fetchAnomalies() {
-  if (!currentDocumentId) return;
-  setLoading("anomaly");
-  const data = await callApi(`/documents/${currentDocumentId}/anomaly-check/`);
-  renderAnomalies(data);
-}
-
-async function fetchOCRCheck() {
-    if (!currentDocumentId) return;
-    setLoading("ocr");
-    
-    const basicOCRData = await callApi(`/documents/${currentDocumentId}/ocr-check/`);
-    const detailedOCRData = await callApi(`/documents/${currentDocumentId}/ocr-detailed-check/`);
-    
-    renderOCRCheck(basicOCRData, detailedOCRData);
-  }
-
-async function fetchFieldExtraction() {
-  if (!currentDocumentId) return;
-  setLoading("field");
-  const data = await callApi(`/documents/${currentDocumentId}/field-extraction/`);
-  renderFieldExtraction(data);
-}
-
-async function fetchQualityReport() {
-  if (!currentDocumentId) return;
-  setLoading("quality");
-  const data = await callApi(`/documents/${currentDocumentId}/quality-check/`);
-  renderQualityReport(data);
-}
-
-
 // --- script.js updated version (partial for Anomalies) ---
 function renderAnomalies(data) {
   const container = document.getElementById("anomalyContent");
@@ -306,7 +294,7 @@ function renderFieldExtraction(data) {
     const docType = page.document_type;
 
     if (!grouped[docType]) {
-      grouped[docType] = { fields: {}, confidences: {} };
+      grouped[docType] = { fields: {}, confidences: {}, failedWindows: page.failed_windows || [] };
     }
 
     const fields = page.fields_extracted || {};
@@ -330,6 +318,16 @@ function renderFieldExtraction(data) {
     heading.textContent = docType;
     section.appendChild(heading);
 
+    // Some page windows of a long document returned nothing, so totals may be short
+    const failedWindows = grouped[docType].failedWindows;
+    if (failedWindows.length) {
+      const partial = document.createElement("p");
+      partial.className = "text-warning";
+      const ranges = failedWindows.map(([first, last]) => first === last ? `${first}` : `${first}-${last}`);
+      partial.textContent = `⚠️ Extraction failed for pages ${ranges.join(", ")}; these fields may be incomplete.`;
+      section.appendChild(partial);
+    }
+
     const list = document.createElement("ul");
     list.className = "list-group";
 
@@ -429,25 +427,6 @@ function scoreToQuality(score) {
   return "Poor";
 }
 
-async function fetchMemo() {
-    if (!currentDocumentId) return;
-    setLoading("memo");
-  
-    try {
-      const response = await fetch(`${backendUrl}/documents/${currentDocumentId}/memo/`, {
-        headers: { Authorization: `Token ${authToken}` }
-      });
-  
-      if (!response.ok) throw new Error("Failed to fetch memo.");
-  
-      const data = await response.json();
-      renderMemo(data);
-    } catch (error) {
-      console.error("Error fetching memo:", error);
-      document.getElementById("memoContent").innerHTML = `<p class="text-danger">Error loading memo.</p>`;
-    }
-  }
-
 function renderMemo(data) {
     const container = document.getElementById("memoContent");
     container.innerHTML = "";
@@ -462,25 +441,6 @@ function renderMemo(data) {
     container.appendChild(textarea);
 }
 
-async function fetchDataValidation() {
-    if (!currentDocumentId) return;
-    setLoading("validation");
-  
-    try {
-      const response = await fetch(`${backendUrl}/documents/${currentDocumentId}/data-validation/`, {
-        headers: { Authorization: `Token ${authToken}` }
-      });
-  
-      if (!response.ok) throw new Error("Failed to fetch data validation report.");
-  
-      const data = await response.json();
-      renderDataValidation(data);
-    } catch (error) {
-      console.error("Error fetching data validation:", error);
-      document.getElementById("validationContent").innerHTML = `<p class="text-danger">Error loading data validation.</p>`;
-    }
-  }
-  
   function renderDataValidation(data) {
     const container = document.getElementById("validationContent");
     container.innerHTML = "";
@@ -156,6 +156,100 @@ CORS_ALLOW_HEADERS = [
     "x-requested-with",
 ]
 
+# Document processing
+# Number of OCR worker processes, each holding its own torch + EasyOCR reader (roughly 1 GB
+# apiece, next to the gunicorn workers), so the default stays small: the CPUs this process
+# may run on (not the host's count inside a container), capped at 2
+_USABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", min(2, _USABLE_CPUS)))
+# Threads making LLM calls while OCR runs on later pages
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", 2))
+# Max pages waiting between two pipeline stages (backpressure / memory cap)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+# "auto" reads a page's embedded text layer and OCRs only when it is empty or garbage,
+# "ocr" always OCRs, "text_layer" never does
+TEXT_EXTRACTION_MODE = os.getenv("TEXT_EXTRACTION_MODE", "auto")
+# A text layer shorter than this, or with a lower share of clean word-like tokens, is OCR'd
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", 40))
+TEXT_LAYER_MIN_QUALITY = float(os.getenv("TEXT_LAYER_MIN_QUALITY", 0.7))
+# Page quality metrics run on a grayscale copy downscaled to this long edge (0 = full 300 dpi)
+QUALITY_MAX_DIMENSION = int(os.getenv("QUALITY_MAX_DIMENSION", 1200))
+# Pages are split into an N x N grid of tiles to catch partially blurred scans
+QUALITY_TILE_GRID = int(os.getenv("QUALITY_TILE_GRID", 4))
+# Laplacian variance below this is blurry. Downscaling raises the variance a lot, so the
+# default of 2400 at 1200 px matches the old full-resolution threshold of 100 on text pages;
+# recalibrate with `manage.py benchmark_quality` when changing QUALITY_MAX_DIMENSION
+QUALITY_BLUR_THRESHOLD = float(os.getenv("QUALITY_BLUR_THRESHOLD", 2400 if QUALITY_MAX_DIMENSION else 100))
+# Share of near-white pixels above this is blank
+QUALITY_BLANK_THRESHOLD = float(os.getenv("QUALITY_BLANK_THRESHOLD", 0.99))
+
+# Content-addressed OCR result cache (SQLite file, LRU-evicted by size)
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "1") == "1"
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", str(BASE_DIR / "cache" / "ocr.sqlite3"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Gemini response cache keyed by model, prompt version and text hash
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(BASE_DIR / "cache" / "llm.sqlite3"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+
+# Computed anomaly/validation reports, keyed by upload, its pages' last rewrite and the rules version
+REPORT_CACHE_ENABLED = os.getenv("REPORT_CACHE_ENABLED", "1") == "1"
+REPORT_CACHE_PATH = os.getenv("REPORT_CACHE_PATH", str(BASE_DIR / "cache" / "reports.sqlite3"))
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+
+# Local first-tier page classifier (keywords + TF-IDF model from `manage.py train_classifier`);
+# pages below the confidence threshold are escalated to the LLM
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "1") == "1"
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("LOCAL_CLASSIFIER_MIN_CONFIDENCE", 0.8))
+LOCAL_CLASSIFIER_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", str(BASE_DIR / "model" / "document_classifier.json"))
+
+# Pages escalated to the LLM are classified several per prompt, from a head sample of their text
+LLM_CLASSIFY_BATCH_SIZE = int(os.getenv("LLM_CLASSIFY_BATCH_SIZE", 12))
+LLM_CLASSIFY_BATCH_MAX_TOKENS = int(os.getenv("LLM_CLASSIFY_BATCH_MAX_TOKENS", 6000))
+LLM_CLASSIFY_HEAD_CHARS = int(os.getenv("LLM_CLASSIFY_HEAD_CHARS", 1500))
+# Seconds the classification stage waits for more escalated pages before sending a batch
+LLM_CLASSIFY_BATCH_WAIT = float(os.getenv("LLM_CLASSIFY_BATCH_WAIT", 2.0))
+
+# OCR text is compacted before it goes into prompts: whitespace and ruling lines dropped,
+# running headers/footers (repeated within N lines of a page edge) removed across a group's
+# pages, and each page capped at an estimated token budget
+PROMPT_COMPACTION_ENABLED = os.getenv("PROMPT_COMPACTION_ENABLED", "1") == "1"
+PROMPT_PAGE_TOKEN_BUDGET = int(os.getenv("PROMPT_PAGE_TOKEN_BUDGET", 2000))
+PROMPT_REPEAT_EDGE_LINES = int(os.getenv("PROMPT_REPEAT_EDGE_LINES", 6))
+
+# Groups longer than this many pages are analysed as concurrent windows of this size and
+# the partial results reduced into one (0 = always one call per group)
+EXTRACTION_WINDOW_PAGES = int(os.getenv("EXTRACTION_WINDOW_PAGES", 6))
+
+# Provider quota shared by every thread and worker process on the host (0 = unlimited)
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 30))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 1_000_000))
+LLM_RATE_LIMIT_PATH = os.getenv("LLM_RATE_LIMIT_PATH", str(BASE_DIR / "cache" / "llm_ratelimit.sqlite3"))
+
+# Wall-clock budget for ingesting one upload; every LLM call gets a deadline inside it
+DOCUMENT_TIME_BUDGET = float(os.getenv("DOCUMENT_TIME_BUDGET", 600))
+# A job whose worker has died this many times (OOM, segfault in OCR) is failed, not requeued
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Per-attempt timeout and retry policy (jittered exponential backoff) for LLM calls
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", 60))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 1.0))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 20.0))
+# Fire a duplicate request once a call outlasts this percentile of recent latencies (0 = off)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 0.95))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+
+# Where prompts go: "gemini" (production), "http" (the `manage.py llm_standin` server at
+# LLM_BACKEND_URL), "replay" (responses recorded at LLM_REPLAY_PATH) or "canned" (offline dummies)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_BACKEND_URL = os.getenv("LLM_BACKEND_URL", "http://127.0.0.1:8765")
+# When set, every backend response is appended here for later replay (turn LLM_CACHE_ENABLED
+# off to record cache hits too)
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH", str(BASE_DIR / "cache" / "llm_recordings.jsonl"))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',